@@ -1,11 +1,14 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.fft import fft2, ifft2, fftshift, ifftshift
-from skimage import io, img_as_float
 from tkinter import Tk, filedialog
+from gfsk_io import read_image, save_result
 import threading
 import queue
+from concurrent.futures import ThreadPoolExecutor
+import sys
+from gfsk_opt import gaussian_transfer, filter_stack
+from gfsk_preview import ProgressivePreview, filter_pages, show_preview_pages, refine_from_queues
 
 def select_image():
     """Function to select an image file using a file dialog."""
@@ -15,122 +18,147 @@ def select_image():
     root.destroy()
     return file_path
 
-def load_image(image_path):
+def load_image(image_path, dtype=np.float64):
     """Function to load an image and convert grayscale to RGB if necessary."""
     try:
-        A = img_as_float(io.imread(image_path))
-        if A.ndim == 2:
+        A, source = read_image(image_path, dtype)
+        if source.grayscale:
             print("Grayscale image loaded. Converting to RGB.")
-            A = np.stack((A, A, A), axis=-1)  # Convert grayscale to RGB by stacking channels
-        return A
+        return A, source
     except Exception as e:
         print(f"Error loading the image: {e}")
-        return None
+        return None, None
 
-def save_image(image, filter_type, D0, D0_low, D0_high):
+def save_image(image, filter_type, D0, D0_low, D0_high, source=None):
     """Function to save an image to the ./result_imgs directory with appropriate naming."""
     if not os.path.exists('./result_imgs'):
         os.makedirs('./result_imgs')
 
     if filter_type == 'bandpass':
-        filename = f"./result_imgs/{filter_type}_D0_low_{D0_low}_D0_high_{D0_high}.png"
+        filename = f"./result_imgs/{filter_type}_D0_low_{D0_low}_D0_high_{D0_high}"
     else:
-        filename = f"./result_imgs/{filter_type}_D0_{D0}.png"
+        filename = f"./result_imgs/{filter_type}_D0_{D0}"
 
-    plt.imsave(filename, image)
+    filename = save_result(filename, image, source)  # Keeps the source's format and bit depth
     print(f"Saved: {filename}")
 
-def fft_filter(A, D0_values, filter_type='highpass', D0_low=None, D0_high=None, block_size=256, overlap=16, border_size=50):
-    """Function to perform frequency domain filtering on an image in blocks with overlap and a border to save memory."""
+def tile_ranges(length, block_size, overlap):
+    """Function to list the tiles along one axis as [start, end, write_start, write_end].
+
+    Each tile is read from start to end, with `overlap` extra context on both sides. Where
+    consecutive tiles would both write the same rows, the earlier write range is trimmed,
+    so the tiles can be written in any order and the result matches the serial loop,
+    where the later tile wins.
+    """
+    tiles = []
+    for i in range(0, length, block_size - overlap):
+        i_start = max(i - overlap, 0)
+        i_end = min(i + block_size + overlap, length)
+        tiles.append([i_start, i_end, max(i, i_start + overlap), min(i + block_size, i_end - overlap)])
+
+    next_start = length
+    for tile in reversed(tiles):
+        if tile[3] > tile[2]:
+            tile[3] = min(tile[3], next_start)
+            next_start = tile[2]
+    return [tile for tile in tiles if tile[3] > tile[2]]
+
+# One pool for every call that does not ask for its own workers, so engines running in
+# several threads at once share os.cpu_count() tile workers instead of each starting a pool
+_tile_executor = None
+_tile_executor_lock = threading.Lock()
+
+def tile_executor():
+    """Function to return the process-wide pool of tile workers, creating it on first use."""
+    global _tile_executor
+    with _tile_executor_lock:
+        if _tile_executor is None:
+            _tile_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _tile_executor
+
+def filter_tiles(A_padded, tiles, transfers, filtered_images):
+    """Function to filter a batch of same-shaped tiles with one batched FFT and write them out."""
+    stack = np.stack([A_padded[i_start:i_end, j_start:j_end] for (i_start, i_end, _, _), (j_start, j_end, _, _) in tiles])
+    filtered_stacks = filter_stack(stack, transfers)
+    for filtered_image, F1 in zip(filtered_images, filtered_stacks):
+        for n, ((i_start, _, i_write_start, i_write_end), (j_start, _, j_write_start, j_write_end)) in enumerate(tiles):
+            filtered_image[i_write_start:i_write_end, j_write_start:j_write_end] = F1[
+                n,
+                i_write_start - i_start:i_write_end - i_start,
+                j_write_start - j_start:j_write_end - j_start
+            ]
+
+def fft_filter(A, D0_values, filter_type='highpass', D0_low=None, D0_high=None, block_size=256, overlap=16, border_size=50, workers=None, batch_tiles=None, source=None, save=True, max_memory=128 * 1024**2):
+    """Function to perform frequency domain filtering on an image in blocks with overlap and a border to save memory.
+
+    Tiles of the same shape are stacked and filtered together, batch_tiles at a time, with one
+    batched forward FFT shared by every D0. The batches run on a pool of `workers` threads
+    that write straight into the shared output images. Without workers they run on the pool
+    shared by all callers, os.cpu_count() threads. batch_tiles defaults to as many tiles as
+    fit in max_memory divided among the workers, so the batches in flight stay within it.
+    """
+    from gfsk_plan import estimate_stack  # gfsk_plan imports this module
     if A is None or D0_values is None:
         return None
+    if filter_type == 'bandpass' and (D0_low is None or D0_high is None):
+        print("D0_low and D0_high must be provided for bandpass filter")
+        return None
 
     [a, b, c] = A.shape
     a_padded = a + 2 * border_size
     b_padded = b + 2 * border_size
 
     # Create a new array with border
-    A_padded = np.zeros((a_padded, b_padded, c))
+    A_padded = np.zeros((a_padded, b_padded, c), dtype=A.dtype)
     A_padded[border_size:a + border_size, border_size:b + border_size, :] = A
 
-    filtered_images = []
-
-    for D0 in D0_values:
-        filtered_image = np.zeros_like(A_padded)
-        for i in range(0, a_padded, block_size - overlap):
-            for j in range(0, b_padded, block_size - overlap):
-                i_start = max(i - overlap, 0)
-                j_start = max(j - overlap, 0)
-                i_end = min(i + block_size + overlap, a_padded)
-                j_end = min(j + block_size + overlap, b_padded)
-                block = A_padded[i_start:i_end, j_start:j_end]
-
-                [bi, bj, bc] = block.shape
-
-                # Perform 2D FFT for each color channel with zero-padding
-                F = fft2(block, s=(2*bi, 2*bj), axes=(0, 1))
-                F3 = fftshift(F, axes=(0, 1))
-
-                W = np.zeros((2*bi, 2*bj, bc))
-                u, v = np.mgrid[-bi:bi, -bj:bj]
-                D_square = (u)**2 + (v)**2
-                if filter_type == 'highpass':
-                    W[:, :, :] = 1 - np.exp(-D_square[:, :, np.newaxis] / (2 * D0**2))
-                elif filter_type == 'lowpass':
-                    W[:, :, :] = np.exp(-D_square[:, :, np.newaxis] / (2 * D0**2))
-                elif filter_type == 'bandpass':
-                    if D0_low is None or D0_high is None:
-                        print("D0_low and D0_high must be provided for bandpass filter")
-                        return None
-                    W_low = np.exp(-D_square[:, :, np.newaxis] / (2 * D0_low**2))
-                    W_high = np.exp(-D_square[:, :, np.newaxis] / (2 * D0_high**2))
-                    W[:, :, :] = W_high - W_low
-
-                # Apply filter in the frequency domain for each channel
-                G = F3 * W
-                F4 = ifftshift(G, axes=(0, 1))
-                F1 = ifft2(F4, axes=(0, 1))
-                F1 = np.real(F1[:bi, :bj, :])
-
-                # Clip filtered image values to [0, 1] range
-                F1 = np.clip(F1, 0, 1)
-
-                # Calculate the non-overlapping region
-                i_block_start = i_start + overlap
-                i_block_end = i_end - overlap
-                j_block_start = j_start + overlap
-                j_block_end = j_end - overlap
-
-                # Ensure we do not exceed image dimensions
-                i_overlap_start = max(i, i_block_start)
-                j_overlap_start = max(j, j_block_start)
-                i_overlap_end = min(i + block_size, i_block_end)
-                j_overlap_end = min(j + block_size, j_block_end)
-
-                # Copy the filtered block into the corresponding position of the result image
-                filtered_image[i_overlap_start:i_overlap_end, j_overlap_start:j_overlap_end] = F1[
-                    i_overlap_start - i_start:i_overlap_end - i_start,
-                    j_overlap_start - j_start:j_overlap_end - j_start
-                ]
-
+    # Group tiles by shape. Interior tiles share one length per axis, but the first tile
+    # lacks its leading overlap and the last one or two are cut short by the far edge, so
+    # each axis can have up to four lengths and the image up to sixteen groups
+    groups = {}
+    for row in tile_ranges(a_padded, block_size, overlap):
+        for col in tile_ranges(b_padded, block_size, overlap):
+            groups.setdefault((row[1] - row[0], col[1] - col[0]), []).append((row, col))
+
+    filtered_images = [np.zeros_like(A_padded) for _ in D0_values]
+    own_executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+    executor = own_executor or tile_executor()
+    budget = max_memory // (workers or os.cpu_count() or 1)
+    try:
+        futures = []
+        for (bi, bj), tiles in groups.items():
+            # The kernel only depends on the tile shape, so build it once per group
+            transfers = [gaussian_transfer((2*bi, 2*bj), filter_type, D0, D0_low, D0_high, dtype=A.dtype) for D0 in D0_values]
+            size = batch_tiles or max(1, int(budget // estimate_stack((bi, bj, c), 1, len(D0_values), A.dtype)))
+            for start in range(0, len(tiles), size):
+                futures.append(executor.submit(filter_tiles, A_padded, tiles[start:start + size], transfers, filtered_images))
+        for future in futures:
+            future.result()  # Re-raise any error from the workers
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown()
+
+    results = []
+    for D0, filtered_image in zip(D0_values, filtered_images):
         # Crop the result to remove the border
         filtered_image = filtered_image[border_size:a + border_size, border_size:b + border_size, :]
 
-        filtered_images.append((filtered_image, filter_type, D0, D0_low, D0_high))
-        save_image(filtered_image, filter_type, D0, D0_low, D0_high)
+        results.append((filtered_image, filter_type, D0, D0_low, D0_high))
+        if save:
+            save_image(filtered_image, filter_type, D0, D0_low, D0_high, source)
 
-    return filtered_images
+    return results
 
 # Define queues for storing filtered images
 high_pass_queue = queue.Queue()
 low_pass_queue = queue.Queue()
 band_pass_queue = queue.Queue()
 
-def run_filter(A, D0_values, filter_type, D0_low=None, D0_high=None,block_size=256, overlap=16, border_size=50, q=None):
-    filtered_images = fft_filter(A, D0_values, filter_type, D0_low, D0_high,block_size, overlap, border_size)
+def run_filter(A, D0_values, filter_type, D0_low=None, D0_high=None,block_size=256, overlap=16, border_size=50, q=None, source=None):
+    filtered_images = fft_filter(A, D0_values, filter_type, D0_low, D0_high,block_size, overlap, border_size, source=source)
     q.put(filtered_images)
 
-def main():
+def main(progressive=False):
     # Clear all previous plots
     plt.close('all')
 
@@ -140,7 +168,7 @@ def main():
         print("No image selected. Exiting.")
         return
 
-    A = load_image(image_path)
+    A, source = load_image(image_path)
     if A is None:
         return
 
@@ -155,15 +183,28 @@ def main():
     overlap=50
     border_size=50
     threads = []
-    threads.append(threading.Thread(target=run_filter, args=(A, highpass_D0_values, 'highpass', None, None, block_size, overlap, border_size, high_pass_queue)))
-    threads.append(threading.Thread(target=run_filter, args=(A, lowpass_D0_values, 'lowpass', None, None, block_size, overlap, border_size, low_pass_queue)))
+    threads.append(threading.Thread(target=run_filter, args=(A, highpass_D0_values, 'highpass', None, None, block_size, overlap, border_size, high_pass_queue, source)))
+    threads.append(threading.Thread(target=run_filter, args=(A, lowpass_D0_values, 'lowpass', None, None, block_size, overlap, border_size, low_pass_queue, source)))
     for D0_low, D0_high in bandpass_D0_values:
-        threads.append(threading.Thread(target=run_filter, args=(A, [10], 'bandpass', D0_low, D0_high, block_size, overlap, border_size, band_pass_queue)))
+        threads.append(threading.Thread(target=run_filter, args=(A, [10], 'bandpass', D0_low, D0_high, block_size, overlap, border_size, band_pass_queue, source)))
+
+    if progressive:
+        # Show coarse previews within milliseconds, before any full resolution work starts
+        preview = ProgressivePreview(A)
+        pages = filter_pages(lowpass_D0_values, highpass_D0_values, bandpass_D0_values)
+        preview_images = show_preview_pages(A, pages, preview)
 
     # Start all threads
     for t in threads:
         t.start()
 
+    if progressive:
+        # Replace each preview with its full resolution result as soon as it is ready
+        refine_from_queues(preview_images, threads, (low_pass_queue, high_pass_queue, band_pass_queue))
+        input("Press Enter to close all figures...")
+        plt.close('all')
+        return
+
     # Wait for all threads to complete
     for t in threads:
         t.join()
@@ -226,4 +267,4 @@ def main():
     plt.close('all')  # Close all figures
 
 if __name__ == "__main__":
-    main()
+    main(progressive='--progressive' in sys.argv[1:])
@@ -1,8 +1,9 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-from skimage import io, img_as_float
 from tkinter import Tk, filedialog
+from gfsk_io import read_image, save_result
+from gfsk_opt import gaussian_transfer, smallest_cutoff, padding_geometry, pad_image
 import torch
 
 os.environ["CUDA_VISIBLE_DEVICES"] = "0"
@@ -23,41 +24,52 @@ def select_image():
     return file_path
 
 
-def load_image(image_path):
+def load_image(image_path, dtype=np.float64):
     """Function to load an image and convert grayscale to RGB if necessary."""
     try:
-        A = img_as_float(io.imread(image_path))
-        if A.ndim == 2:
+        A, source = read_image(image_path, dtype)
+        if source.grayscale:
             print("Grayscale image loaded. Converting to RGB.")
-            A = np.stack(
-                (A, A, A), axis=-1
-            )  # Convert grayscale to RGB by stacking channels
-        return A
+        return A, source
     except Exception as e:
         print(f"Error loading the image: {e}")
-        return None
+        return None, None
 
 
-def save_image(image, filter_type, D0, D0_low, D0_high):
+def save_image(image, filter_type, D0, D0_low, D0_high, source=None):
     """Function to save an image to the ./result_imgs directory with appropriate naming."""
     if not os.path.exists("./result_imgs"):
         os.makedirs("./result_imgs")
 
     if filter_type == "bandpass":
-        filename = f"./result_imgs/{filter_type}_D0_low_{D0_low}_D0_high_{D0_high}.png"
+        filename = f"./result_imgs/{filter_type}_D0_low_{D0_low}_D0_high_{D0_high}"
     else:
-        filename = f"./result_imgs/{filter_type}_D0_{D0}.png"
+        filename = f"./result_imgs/{filter_type}_D0_{D0}"
+
+    filename = save_result(filename, image, source)  # Keeps the source's format and bit depth
 
-    plt.imsave(filename, image)
 
+def fft_filter(A, D0_values, filter_type="highpass", D0_low=None, D0_high=None, source=None, workers=None, save=True, padding="double", tol=1e-3):
+    """Function to perform frequency domain filtering on an image using PyTorch.
 
-def fft_filter(A, D0_values, filter_type="highpass", D0_low=None, D0_high=None):
-    """Function to perform frequency domain filtering on an image using PyTorch."""
+    workers sets torch's CPU thread count for the CPU fallback. With save=False the results
+    are only returned, not written to ./result_imgs. padding and tol select the padding
+    mode as in gfsk_opt.padding_geometry.
+    """
     print("Starting FFT filter...")
     if A is None or D0_values is None:
         return None
+    if filter_type == "bandpass" and (D0_low is None or D0_high is None):
+        print("D0_low and D0_high must be provided for bandpass filter")
+        return None
+    if workers is not None:
+        torch.set_num_threads(workers)
 
     [a, b, c] = A.shape
+    # Zero-pad (or mirror) enough to avoid circular wrap-around
+    D0_min = smallest_cutoff(filter_type, D0_values, D0_low, D0_high)
+    shape, (top, left) = padding_geometry(a, b, D0_min, padding, tol)
+    A = pad_image(A, shape, (top, left), padding)
 
     # Try to use CUDA if available and sufficient memory, otherwise fall back to CPU
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -76,46 +88,30 @@ def fft_filter(A, D0_values, filter_type="highpass", D0_low=None, D0_high=None):
     filtered_images = []
 
     for D0 in D0_values:
-        W = torch.zeros((2 * a, 2 * b), dtype=torch.float32, device=device)
-        u, v = torch.meshgrid(
-            torch.arange(-a, a, device=device),
-            torch.arange(-b, b, device=device),
-            indexing="ij",
-        )
-        D_square = u**2 + v**2
-        if filter_type == "highpass":
-            W[:, :] = 1 - torch.exp(-D_square / (2 * D0**2))
-        elif filter_type == "lowpass":
-            W[:, :] = torch.exp(-D_square / (2 * D0**2))
-        elif filter_type == "bandpass":
-            if D0_low is None or D0_high is None:
-                print("D0_low and D0_high must be provided for bandpass filter")
-                return None
-            W_low = torch.exp(-D_square / (2 * D0_low**2))
-            W_high = torch.exp(-D_square / (2 * D0_high**2))
-            W[:, :] = W_high - W_low
+        # Same rfft2-layout kernel as the numpy engines; D0 stays in bins of the (2a, 2b) grid
+        W = torch.from_numpy(
+            gaussian_transfer(shape, filter_type, D0, D0_low, D0_high, dtype=np.float32, ref_shape=(2 * a, 2 * b))
+        ).to(device)
 
         filtered_image = np.zeros((a, b, c), dtype=np.float32)
 
         for channel in range(c):
             A_channel = A_tensor[:, :, channel]
 
-            # Perform 2D FFT for the channel with zero-padding using PyTorch
-            F = torch.fft.fftn(A_channel, s=(2 * a, 2 * b))
-            F_shifted = torch.fft.fftshift(F, dim=(0, 1))
+            # Perform the real 2D FFT for the channel, zero-padded to the FFT shape
+            F = torch.fft.rfftn(A_channel, s=shape)
 
             # Apply filter in the frequency domain for the channel
-            G = F_shifted * W
-            G_ifftshift = torch.fft.ifftshift(G, dim=(0, 1))
-            F1 = torch.fft.ifftn(G_ifftshift, dim=(0, 1))
-            F1 = torch.real(F1[:a, :b])
+            G = F * W
+            F1 = torch.fft.irfftn(G, s=shape)[top:top + a, left:left + b]
 
             # Clip filtered image values to [0, 1] range
             filtered_image[:, :, channel] = torch.clamp(F1, 0, 1).cpu().numpy()
 
         filtered_images.append((filtered_image, filter_type, D0, D0_low, D0_high))
 
-        save_image(filtered_image, filter_type, D0, D0_low, D0_high)
+        if save:
+            save_image(filtered_image, filter_type, D0, D0_low, D0_high, source)
 
     return filtered_images
 
@@ -130,7 +126,7 @@ def main():
         print("No image selected. Exiting.")
         return
 
-    A = load_image(image_path)
+    A, source = load_image(image_path)
     if A is None:
         return
 
@@ -140,16 +136,16 @@ def main():
     bandpass_D0_values = [(5, 10), (10, 30), (5, 30)]
 
     # Perform high-pass filtering
-    high_pass_filtered_images = fft_filter(A, highpass_D0_values, "highpass")
+    high_pass_filtered_images = fft_filter(A, highpass_D0_values, "highpass", source=source)
 
     # Perform low-pass filtering
-    low_pass_filtered_images = fft_filter(A, lowpass_D0_values, "lowpass")
+    low_pass_filtered_images = fft_filter(A, lowpass_D0_values, "lowpass", source=source)
 
     # Perform band-pass filtering
     band_pass_filtered_images = []
     for D0_low, D0_high in bandpass_D0_values:
         band_pass_filtered_images.extend(
-            fft_filter(A, [10], "bandpass", D0_low, D0_high)
+            fft_filter(A, [10], "bandpass", D0_low, D0_high, source=source)
         )
 
     # Process and plot images for each page
@@ -1,11 +1,14 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.fft import fft2, ifft2, fftshift, ifftshift
-from skimage import io, img_as_float
 from tkinter import Tk, filedialog
+from gfsk_io import read_image, save_result
 import threading
 import queue
+import sys
+from gfsk_opt import filter_image
+from gfsk_cache import SpectrumCache
+from gfsk_preview import ProgressivePreview, filter_pages, show_preview_pages, refine_from_queues
 
 def select_image():
     """Function to select an image file using a file dialog."""
@@ -15,72 +18,38 @@ def select_image():
     root.destroy()
     return file_path
 
-def load_image(image_path):
+def load_image(image_path, dtype=np.float64):
     """Function to load an image and convert grayscale to RGB if necessary."""
     try:
-        A = img_as_float(io.imread(image_path))
-        if A.ndim == 2:
+        A, source = read_image(image_path, dtype)
+        if source.grayscale:
             print("Grayscale image loaded. Converting to RGB.")
-            A = np.stack((A, A, A), axis=-1)  # Convert grayscale to RGB by stacking channels
-        return A
+        return A, source
     except Exception as e:
         print(f"Error loading the image: {e}")
-        return None
+        return None, None
 
-def save_image(image, filter_type, D0, D0_low, D0_high):
+def save_image(image, filter_type, D0, D0_low, D0_high, source=None):
     """Function to save an image to the ./result_imgs directory with appropriate naming."""
     if not os.path.exists('./result_imgs'):
         os.makedirs('./result_imgs')
 
     if filter_type == 'bandpass':
-        filename = f"./result_imgs/{filter_type}_D0_low_{D0_low}_D0_high_{D0_high}.png"
+        filename = f"./result_imgs/{filter_type}_D0_low_{D0_low}_D0_high_{D0_high}"
     else:
-        filename = f"./result_imgs/{filter_type}_D0_{D0}.png"
+        filename = f"./result_imgs/{filter_type}_D0_{D0}"
 
-    plt.imsave(filename, image)
+    filename = save_result(filename, image, source)  # Keeps the source's format and bit depth
     # print(f"Saved: {filename}")
 
-def fft_filter(A, D0_values, filter_type='highpass', D0_low=None, D0_high=None):
+def fft_filter(A, D0_values, filter_type='highpass', D0_low=None, D0_high=None, cache=None, source=None, padding='double', tol=1e-3):
     """Function to perform frequency domain filtering on an image."""
-    if A is None or D0_values is None:
+    filtered_images = filter_image(A, D0_values, filter_type, D0_low, D0_high, cache=cache, padding=padding, tol=tol)
+    if filtered_images is None:
         return None
 
-    [a, b, c] = A.shape
-
-    # Perform 2D FFT for each color channel with zero-padding
-    F = fft2(A, s=(2*a, 2*b), axes=(0, 1))
-    F3 = fftshift(F, axes=(0, 1))
-
-    filtered_images = []
-
-    for D0 in D0_values:
-        W = np.zeros((2*a, 2*b, c))
-        u, v = np.mgrid[-a:a, -b:b]  # Use NumPy indexing for performance
-        D_square = (u)**2 + (v)**2
-        if filter_type == 'highpass':
-            W[:, :, :] = 1 - np.exp(-D_square[:, :, np.newaxis] / (2 * D0 **2))
-        elif filter_type == 'lowpass':
-            W[:, :, :] = np.exp(-D_square[:, :, np.newaxis] / (2 * D0**2))
-        elif filter_type == 'bandpass':
-            if D0_low is None or D0_high is None:
-                print("D0_low and D0_high must be provided for bandpass filter")
-                return None
-            W_low = np.exp(-D_square[:, :, np.newaxis] / (2 * D0_low**2))
-            W_high = np.exp(-D_square[:, :, np.newaxis] / (2 * D0_high**2))
-            W[:, :, :] = W_high - W_low
-
-        # Apply filter in the frequency domain for each channel
-        G = F3 * W
-        F4 = ifftshift(G, axes=(0, 1))
-        F1 = ifft2(F4, axes=(0, 1))
-        F1 = np.real(F1[:a, :b, :])
-
-        # Clip filtered image values to [0, 1] range
-        F1 = np.clip(F1, 0, 1)
-
-        filtered_images.append((F1, filter_type, D0, D0_low, D0_high))
-        
-        save_image(F1, filter_type, D0, D0_low, D0_high)
+    for F1, filter_type, D0, D0_low, D0_high in filtered_images:
+        save_image(F1, filter_type, D0, D0_low, D0_high, source)
 
     return filtered_images
 
@@ -90,11 +59,11 @@ high_pass_queue = queue.Queue()
 low_pass_queue = queue.Queue()
 band_pass_queue = queue.Queue()
 
-def run_filter(A, D0_values, filter_type, D0_low=None, D0_high=None, q=None):
-    filtered_images = fft_filter(A, D0_values, filter_type, D0_low, D0_high)
+def run_filter(A, D0_values, filter_type, D0_low=None, D0_high=None, q=None, cache=None, source=None):
+    filtered_images = fft_filter(A, D0_values, filter_type, D0_low, D0_high, cache, source)
     q.put(filtered_images)
 
-def main():
+def main(progressive=False):
     # Clear all previous plots
     plt.close('all')
 
@@ -104,7 +73,7 @@ def main():
         print("No image selected. Exiting.")
         return
 
-    A = load_image(image_path)
+    A, source = load_image(image_path)
     if A is None:
         return
 
@@ -113,17 +82,33 @@ def main():
     lowpass_D0_values = [20, 10, 5]
     bandpass_D0_values = [(5, 10), (10, 30), (5, 30)]
 
+    # Reuse spectra and outputs from earlier runs on the same image
+    cache = SpectrumCache()
+
     # Create threads for high-pass, low-pass, and band-pass filters
     threads = []
-    threads.append(threading.Thread(target=run_filter, args=(A, highpass_D0_values, 'highpass', None, None, high_pass_queue)))
-    threads.append(threading.Thread(target=run_filter, args=(A, lowpass_D0_values, 'lowpass', None, None, low_pass_queue)))
+    threads.append(threading.Thread(target=run_filter, args=(A, highpass_D0_values, 'highpass', None, None, high_pass_queue, cache, source)))
+    threads.append(threading.Thread(target=run_filter, args=(A, lowpass_D0_values, 'lowpass', None, None, low_pass_queue, cache, source)))
     for D0_low, D0_high in bandpass_D0_values:
-        threads.append(threading.Thread(target=run_filter, args=(A, [10], 'bandpass', D0_low, D0_high, band_pass_queue)))
+        threads.append(threading.Thread(target=run_filter, args=(A, [10], 'bandpass', D0_low, D0_high, band_pass_queue, cache, source)))
+
+    if progressive:
+        # Show coarse previews within milliseconds, before any full resolution work starts
+        preview = ProgressivePreview(A)
+        pages = filter_pages(lowpass_D0_values, highpass_D0_values, bandpass_D0_values)
+        preview_images = show_preview_pages(A, pages, preview)
 
     # Start all threads
     for t in threads:
         t.start()
 
+    if progressive:
+        # Replace each preview with its full resolution result as soon as it is ready
+        refine_from_queues(preview_images, threads, (low_pass_queue, high_pass_queue, band_pass_queue))
+        input("Press Enter to close all figures...")
+        plt.close('all')
+        return
+
     # Wait for all threads to complete
     for t in threads:
         t.join()
@@ -186,4 +171,4 @@ def main():
     plt.close('all')  # Close all figures
 
 if __name__ == "__main__":
-    main()
+    main(progressive='--progressive' in sys.argv[1:])
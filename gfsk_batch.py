@@ -0,0 +1,171 @@
+import os
+import numpy as np
+from gfsk_opt import gaussian_transfer, filter_spec, filter_stack, forward_stack, inverse_stack, smallest_cutoff, padding_geometry
+from gfsk_plan import estimate_stack
+from gfsk_io import read_image, save_result, scale_samples
+
+
+def compute_dtype(dtype, default=np.float32):
+    """Function to pick the float dtype an image is filtered in, or None if it cannot be filtered.
+
+    Integer images are scaled into `default` as gfsk_io.read_image does; float images keep
+    their precision, but never less than single.
+    """
+    if np.issubdtype(dtype, np.integer):
+        return np.dtype(default)
+    if np.issubdtype(dtype, np.floating):
+        return np.result_type(dtype, np.float32)
+    return None
+
+def batch_size(shape, n_outputs, dtype, max_memory):
+    """Function to give how many images of one shape can be filtered together within max_memory."""
+    return max(1, int(max_memory // estimate_stack(shape, 1, n_outputs, dtype)))
+
+def group_transfers(shape, D0_values, filter_type, D0_low, D0_high, dtype, padding='double', tol=1e-3):
+    """Function to build the padded geometry and the transfer functions shared by one shape."""
+    [a, b, c] = shape
+    D0_min = smallest_cutoff(filter_type, D0_values, D0_low, D0_high)
+    padded_shape, offset = padding_geometry(a, b, D0_min, padding, tol)
+    transfers = [gaussian_transfer(padded_shape, filter_type, D0, D0_low, D0_high, dtype=dtype, ref_shape=(2*a, 2*b))
+                 for D0 in D0_values]
+    return transfers, dict(shape=padded_shape, offset=offset, padding=padding)
+
+def filter_group(images, transfers, workers=None, geometry=None):
+    """Function to filter a list of same-shaped images as one (N, a, b, c) stack.
+
+    Returns one list per image holding its output for each transfer. If the stack does not
+    fit after all, it is split in half and each half is retried.
+    """
+    geometry = geometry or {}
+    try:
+        filtered_stacks = filter_stack(np.stack(images), transfers, workers=workers, **geometry)
+    except MemoryError:
+        if len(images) == 1:
+            raise
+        half = len(images) // 2
+        return (filter_group(images[:half], transfers, workers, geometry)
+                + filter_group(images[half:], transfers, workers, geometry))
+    return [[F1[n] for F1 in filtered_stacks] for n in range(len(images))]
+
+def filter_cached(images, keys, transfers, specs, cache, workers=None, geometry=None):
+    """Function to filter same-shaped images through a SpectrumCache, computing only what is missing.
+
+    Outputs already cached are loaded. Images that still need an output reuse their cached
+    spectrum when there is one; the rest are transformed together as one stack, and each
+    image's slice of that spectrum is cached the way filter_image would store it. Every
+    missing output is then computed with one batched inverse over the images lacking it.
+    Returns one list per image holding its output for each transfer.
+    """
+    geometry = geometry or {}
+    outputs = [[cache.load_result(key, spec) for spec in specs] for key in keys]
+    pending = [n for n, row in enumerate(outputs) if any(F1 is None for F1 in row)]
+    spectra = {n: cache.load_spectrum(keys[n]) for n in pending}
+
+    missing = [n for n in pending if spectra[n] is None]
+    if missing:
+        F = forward_stack(np.stack([images[n] for n in missing]), workers=workers, **geometry)
+        for n, F_n in zip(missing, F):
+            cache.save_spectrum(keys[n], F_n)
+            spectra[n] = F_n
+
+    for t, (W, spec) in enumerate(zip(transfers, specs)):
+        needed = [n for n in pending if outputs[n][t] is None]
+        if not needed:
+            continue
+        F1 = inverse_stack(np.stack([spectra[n] for n in needed]), W, images[0].shape, workers,
+                           geometry.get('shape'), geometry.get('offset', (0, 0)))
+        for n, F1_n in zip(needed, F1):
+            cache.save_result(keys[n], spec, F1_n)
+            outputs[n][t] = F1_n
+    return outputs
+
+def fft_filter_batch(images, D0_values, filter_type='highpass', D0_low=None, D0_high=None, max_memory=1024**3, workers=None, padding='double', tol=1e-3, cache=None, dtype=np.float32):
+    """Function to filter many images, stacking those of the same shape into batched FFTs.
+
+    Each batch runs one forward FFT, applies every D0's transfer function by broadcasting
+    and runs one inverse FFT per D0. Batches are as large as max_memory allows; the last
+    batch of each shape is simply smaller. Returns, for each input image in order, the same
+    list of (F1, filter_type, D0, D0_low, D0_high) tuples as gfsk_opt.filter_image.
+    padding and tol select the padding mode as in gfsk_opt.padding_geometry.
+
+    Integer images are scaled to [0, 1] in `dtype`, a batch at a time. With a SpectrumCache,
+    only the outputs and spectra not cached yet are computed (see filter_cached), under the
+    same keys gfsk_opt.filter_image uses, so a sweep that adds a D0 runs just the new inverse.
+    """
+    if images is None or D0_values is None:
+        return None
+    if filter_type == 'bandpass' and (D0_low is None or D0_high is None):
+        print("D0_low and D0_high must be provided for bandpass filter")
+        return None
+
+    groups = {}
+    for index, A in enumerate(images):
+        image_dtype = compute_dtype(A.dtype, dtype)
+        if image_dtype is None:
+            print(f"Cannot filter images of dtype {A.dtype}")
+            return None
+        groups.setdefault((A.shape, image_dtype), []).append(index)
+
+    specs = [filter_spec(filter_type, D0, D0_low, D0_high) for D0 in D0_values]
+    results = [None] * len(images)
+    for (shape, image_dtype), indices in groups.items():
+        # The transfer functions are shared by every image of this shape
+        transfers, geometry = group_transfers(shape, D0_values, filter_type, D0_low, D0_high, image_dtype, padding, tol)
+        top, left = geometry['offset']
+        size = batch_size(shape, len(D0_values), image_dtype, max_memory)
+        for start in range(0, len(indices), size):
+            chunk = indices[start:start + size]
+            scaled = [scale_samples(images[index], image_dtype) for index in chunk]
+            if cache is None:
+                filtered = filter_group(scaled, transfers, workers, geometry)
+            else:
+                keys = [cache.image_key(A, geometry['shape'], f"{padding}_{top}_{left}") for A in scaled]
+                filtered = filter_cached(scaled, keys, transfers, specs, cache, workers, geometry)
+            for index, outputs in zip(chunk, filtered):
+                results[index] = [(F1, filter_type, D0, D0_low, D0_high) for F1, D0 in zip(outputs, D0_values)]
+    return results
+
+def filter_files(image_paths, D0_values, filter_type='highpass', D0_low=None, D0_high=None, out_dir='./result_imgs', max_memory=1024**3, dtype=np.float32, workers=None, padding='double', tol=1e-3, cache=None):
+    """Function to filter a corpus of image files in same-shape batches and write every output.
+
+    Images are decoded as they are reached and held back until a full batch of their shape
+    has accumulated, so only about one batch per shape is in memory at a time. Leftover
+    images of each shape are flushed as smaller batches at the end. Outputs keep the source
+    format and bit depth. A SpectrumCache is consulted as in fft_filter_batch. Returns the
+    paths written.
+    """
+    if filter_type == 'bandpass' and (D0_low is None or D0_high is None):
+        print("D0_low and D0_high must be provided for bandpass filter")
+        return None
+    os.makedirs(out_dir, exist_ok=True)
+
+    pending = {}
+    pending_bytes = 0
+    written = []
+
+    def flush(shape):
+        nonlocal pending_bytes
+        batch = pending.pop(shape)
+        pending_bytes -= sum(A.nbytes for _, A, _ in batch)
+        outputs = fft_filter_batch([A for _, A, _ in batch], D0_values, filter_type, D0_low, D0_high, max_memory,
+                                   workers, padding, tol, cache, dtype)
+        for (image_path, _, source), filtered_images in zip(batch, outputs):
+            stem = os.path.splitext(os.path.basename(image_path))[0]
+            for F1, _, D0, _, _ in filtered_images:
+                file_stem = os.path.join(out_dir, f"{stem}_{filter_spec(filter_type, D0, D0_low, D0_high)}")
+                written.append(save_result(file_stem, F1, source))
+
+    for image_path in image_paths:
+        A, source = read_image(image_path, dtype)
+        batch = pending.setdefault(A.shape, [])
+        batch.append((image_path, A, source))
+        pending_bytes += A.nbytes
+        if len(batch) >= batch_size(A.shape, len(D0_values), dtype, max_memory):
+            flush(A.shape)
+        elif pending_bytes > max_memory // 4:
+            # Too many shapes waiting at once: run the largest partial batch early
+            flush(max(pending, key=lambda shape: len(pending[shape]) * np.prod(shape)))
+
+    for shape in list(pending):
+        flush(shape)
+    return written
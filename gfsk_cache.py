@@ -0,0 +1,97 @@
+import os
+import hashlib
+import tempfile
+import threading
+import numpy as np
+
+
+class SpectrumCache:
+    """On-disk cache of forward spectra and filtered outputs, keyed by image content.
+
+    Entries are plain .npy files so they can be memory-mapped on load. Every hit refreshes
+    the file's modification time, and the oldest files are evicted first once the total
+    size goes over max_bytes. One cache may be shared by several threads: eviction is
+    serialised, and an entry another thread removes in the meantime is treated as a miss.
+    """
+
+    def __init__(self, root='./.gfsk_cache', max_bytes=2 * 1024**3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def image_key(self, A, shape, padding='double'):
+        """Function to hash the image content together with the padding and precision."""
+        h = hashlib.sha256()
+        h.update(np.ascontiguousarray(A).view(np.uint8).data)
+        h.update(f"{A.shape}|{A.dtype.str}|{tuple(shape)}|{padding}".encode())
+        return h.hexdigest()
+
+    def _path(self, key, spec=None):
+        name = f"{key}.npy" if spec is None else f"{key}_{spec}.npy"
+        return os.path.join(self.root, name)
+
+    def _load(self, path):
+        try:
+            array = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None  # Missing or partially written entry
+        try:
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:
+            pass  # Evicted after the load; the mapping stays valid on POSIX
+        return array
+
+    def _save(self, path, array):
+        # Write to a temporary name first so readers never see a half-written file
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def load_spectrum(self, key):
+        """Function to load a cached forward spectrum, or None if it is not cached."""
+        return self._load(self._path(key))
+
+    def save_spectrum(self, key, F):
+        """Function to store a forward spectrum in the cache."""
+        self._save(self._path(key), F)
+
+    def load_result(self, key, spec):
+        """Function to load a cached filtered output, or None if it is not cached."""
+        return self._load(self._path(key, spec))
+
+    def save_result(self, key, spec, F1):
+        """Function to store a filtered output in the cache."""
+        self._save(self._path(key, spec), F1)
+
+    def evict(self):
+        """Function to delete least recently used entries until the cache fits max_bytes."""
+        with self._evict_lock:
+            entries = []
+            for entry in os.scandir(self.root):
+                if entry.name.endswith('.npy'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue  # Removed by another process since the scan
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # Already gone
+                except OSError:
+                    continue  # Still memory-mapped somewhere (Windows); try again next time
+                total -= size
@@ -0,0 +1,75 @@
+import os
+from collections import namedtuple
+import numpy as np
+from skimage import io
+
+# Formats that can hold 16-bit samples; anything else is written back as 8-bit
+SIXTEEN_BIT_FORMATS = ('.png', '.tif', '.tiff')
+
+SourceInfo = namedtuple('SourceInfo', ['extension', 'dtype', 'grayscale'])
+
+
+def read_image(image_path, dtype=np.float32):
+    """Function to decode an image straight into the compute dtype, scaled to [0, 1].
+
+    Integer samples are scaled in the same pass that converts them, so there is no
+    intermediate float64 copy. Grayscale images are returned as a read-only RGB view of a
+    single channel. Returns the image and a SourceInfo describing the file it came from.
+    """
+    raw = io.imread(image_path)
+    A = scale_samples(raw, dtype)
+
+    grayscale = A.ndim == 2
+    if grayscale:
+        A = np.broadcast_to(A[:, :, np.newaxis], A.shape + (3,))  # RGB without copying the channel
+
+    source = SourceInfo(os.path.splitext(image_path)[1].lower(), raw.dtype, grayscale)
+    return A, source
+
+def scale_samples(raw, dtype=np.float32):
+    """Function to convert samples to the compute dtype, scaling integers to [0, 1] in the same pass."""
+    if np.issubdtype(raw.dtype, np.integer):
+        return np.multiply(raw, 1.0 / np.iinfo(raw.dtype).max, dtype=dtype)
+    return raw.astype(dtype, copy=False)
+
+def output_format(source=None):
+    """Function to pick the file extension and integer dtype results should be written with."""
+    if source is None:
+        return '.png', np.uint8
+    extension = source.extension or '.png'
+    if source.dtype.itemsize > 1 and extension in SIXTEEN_BIT_FORMATS:
+        return extension, np.uint16
+    return extension, np.uint8
+
+def quantize(F1, dtype=np.uint8, strip_bytes=1 << 18):
+    """Function to clip a [0, 1] image, scale it to dtype's range, round and cast in one pass.
+
+    The work is done a strip of rows at a time in a small scratch buffer that stays in
+    cache, so the full-size input is read once and the output written once.
+    """
+    maxval = np.iinfo(dtype).max
+    out = np.empty(F1.shape, dtype=dtype)
+    row_bytes = max(1, F1[:1].size * F1.itemsize)
+    strip_rows = max(1, strip_bytes // row_bytes)
+    buf = np.empty((strip_rows,) + F1.shape[1:], dtype=F1.dtype)
+    for start in range(0, F1.shape[0], strip_rows):
+        rows = F1[start:start + strip_rows]
+        strip = buf[:len(rows)]
+        np.multiply(rows, maxval, out=strip)
+        np.clip(strip, 0, maxval, out=strip)
+        np.rint(strip, out=strip)
+        out[start:start + len(rows)] = strip
+    return out
+
+def write_image(file_path, F1, dtype=np.uint8):
+    """Function to write a [0, 1] image as 8 or 16-bit integers."""
+    io.imsave(file_path, quantize(F1, dtype), check_contrast=False)
+
+def save_result(file_stem, F1, source=None):
+    """Function to write a filtered image in the source's format and bit depth; returns the path."""
+    extension, dtype = output_format(source)
+    if source is not None and source.grayscale:
+        F1 = F1[:, :, 0]  # The channels were identical copies of the source
+    file_path = file_stem + extension
+    write_image(file_path, F1, dtype)
+    return file_path
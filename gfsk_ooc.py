@@ -0,0 +1,186 @@
+import os
+import argparse
+import tempfile
+import numpy as np
+from numpy.lib.format import open_memmap
+from scipy.fft import rfft, irfft, fft, ifft
+from gfsk_opt import filter_spec, smallest_cutoff, padding_geometry
+
+
+def gaussian_factor(n, ref_n, D0, dtype, indices=None):
+    """Function to build one axis of the separable Gaussian exp(-u^2 / 2 D0^2) in FFT order.
+
+    indices selects a strip of the axis; by default all n bins in full FFT order. D0 is in
+    bins of a ref_n long axis, as in gfsk_opt.gaussian_transfer.
+    """
+    u = np.fft.fftfreq(n, 1.0 / n) if indices is None else np.asarray(indices, dtype=np.float64)
+    u = u * (ref_n / n)
+    return np.exp(-u**2 / (2 * D0**2)).astype(dtype)
+
+def transfer_strip(shape, ref_shape, columns, filter_type, D0, D0_low, D0_high, dtype):
+    """Function to build the rfft2-layout transfer function for a strip of columns from its 1-D factors."""
+    P, Q = shape
+    ref_P, ref_Q = ref_shape
+
+    def lowpass(cutoff):
+        return np.outer(gaussian_factor(P, ref_P, cutoff, dtype), gaussian_factor(Q, ref_Q, cutoff, dtype, columns))
+
+    if filter_type == 'highpass':
+        return 1 - lowpass(D0)
+    elif filter_type == 'lowpass':
+        return lowpass(D0)
+    elif filter_type == 'bandpass':
+        return lowpass(D0_high) - lowpass(D0_low)
+    raise ValueError(f"Unknown filter type: {filter_type}")
+
+def read_rows(A, start, stop, dtype):
+    """Function to read a strip of rows in the compute dtype, scaling integer samples to [0, 1]."""
+    rows = np.asarray(A[start:stop])
+    if rows.ndim == 2:
+        rows = rows[:, :, np.newaxis]
+    if np.issubdtype(rows.dtype, np.integer):
+        return np.multiply(rows, 1.0 / np.iinfo(rows.dtype).max, dtype=dtype)
+    return rows.astype(dtype, copy=False)
+
+def scratch_blocks(path, a, Qh, c, width, dtype):
+    """Function to create a scratch file holding an (a, Qh, c) spectrum as blocks of columns.
+
+    The file is an (n_blocks, a, width, c) array: block k holds columns k*width onwards and
+    is contiguous on disk, so the column pass reads and writes it in one sequential piece.
+    The last block is padded with unused zero columns.
+    """
+    return open_memmap(path, mode='w+', dtype=dtype, shape=(-(-Qh // width), a, width, c))
+
+def scatter_rows(blocks, start, strip):
+    """Function to write a strip of rows of the (a, Qh, c) spectrum into its column blocks."""
+    n_blocks, _, width, c = blocks.shape
+    rows, Qh = strip.shape[:2]
+    full = Qh // width
+    blocks[:full, start:start + rows] = strip[:, :full * width].reshape(rows, full, width, c).swapaxes(0, 1)
+    if full < n_blocks:
+        blocks[full, start:start + rows, :Qh - full * width] = strip[:, full * width:]
+
+def gather_rows(blocks, start, rows):
+    """Function to read a strip of rows of the spectrum from its column blocks into rows.
+
+    rows is a contiguous (n, n_blocks * width, c) buffer; the padding columns of the last
+    block come along and are sliced off by the caller.
+    """
+    n_blocks, _, width, c = blocks.shape
+    n = len(rows)
+    rows.reshape(n, n_blocks, width, c)[...] = blocks[:, start:start + n].swapaxes(0, 1)
+
+
+def ooc_filter(A, D0_values, filter_type='highpass', D0_low=None, D0_high=None, out_dir='./result_imgs', scratch_dir=None, strip_bytes=64 * 1024**2, dtype=np.float64, padding='double', tol=1e-3):
+    """Function to filter an image larger than memory exactly, with a two-pass FFT over memory-mapped files.
+
+    A is an (a, b) or (a, b, c) array, typically np.load(path, mmap_mode='r'), or the path
+    of an .npy file. The padded 2-D FFT is done as real row transforms written to a scratch
+    file, then column transforms over blocks of columns of that file. The separable Gaussian
+    transfer function is applied to each block before its inverse column transform, and the
+    inverse row transforms produce the output. Only the first a rows and b columns are
+    needed, so both inverses drop the padding as soon as they can. The scratch spectra are
+    stored block by block (see scratch_blocks), so every pass reads and writes contiguous runs.
+
+    Each strip or block is sized so its working set stays near strip_bytes, which bounds peak
+    memory whatever the image size. A ValueError is raised when strip_bytes cannot hold even
+    one padded row or column. The outputs match gfsk_opt.filter_image. They are written to
+    out_dir as .npy files and returned memory-mapped, as (F1, filter_type, D0, D0_low,
+    D0_high) tuples. padding may be 'double' or 'zero'; the mirrored modes are not supported.
+    """
+    if A is None or D0_values is None:
+        return None
+    if filter_type == 'bandpass' and (D0_low is None or D0_high is None):
+        print("D0_low and D0_high must be provided for bandpass filter")
+        return None
+    if padding not in ('double', 'zero'):
+        raise ValueError(f"Out-of-core filtering supports 'double' and 'zero' padding, not {padding}")
+    if isinstance(A, str):
+        A = np.load(A, mmap_mode='r')
+
+    a, b = A.shape[:2]
+    c = A.shape[2] if A.ndim == 3 else 1
+    shape, _ = padding_geometry(a, b, smallest_cutoff(filter_type, D0_values, D0_low, D0_high), padding, tol)
+    P, Q = shape
+    Qh = Q // 2 + 1
+    ref_shape = (2*a, 2*b)
+    cdtype = np.result_type(dtype, np.complex64)
+    csize = np.dtype(cdtype).itemsize
+
+    # Rows per strip for the row passes, columns per block for the column pass. A column
+    # transform needs the whole column, so a budget below one row or column cannot be met.
+    row_bytes = 3 * Q * c * csize
+    column_bytes = 4 * P * c * csize
+    if strip_bytes < max(row_bytes, column_bytes):
+        raise ValueError(f"strip_bytes={strip_bytes} is too small: one padded row needs {row_bytes} bytes "
+                         f"and one padded column {column_bytes} bytes")
+    # Never more than the image has, or small images would get budget-sized scratch and buffers
+    strip_rows = min(strip_bytes // row_bytes, a)
+    strip_cols = min(strip_bytes // column_bytes, Qh)
+
+    os.makedirs(out_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as scratch:
+        # Pass 1: real FFT of every row, zero-padded to Q, scattered into the column blocks.
+        # Rows a..P-1 are all zeros, so they are never stored; the column FFT zero-pads them back in.
+        rows_fft = scratch_blocks(os.path.join(scratch, 'rows.npy'), a, Qh, c, strip_cols, cdtype)
+        for start in range(0, a, strip_rows):
+            stop = min(start + strip_rows, a)
+            scatter_rows(rows_fft, start, rfft(read_rows(A, start, stop, dtype), n=Q, axis=1))
+
+        # Pass 2: for each block of columns, FFT down the columns, apply every filter and
+        # inverse FFT back, keeping only the first a rows
+        filtered_fft = [
+            scratch_blocks(os.path.join(scratch, f'filtered_{n}.npy'), a, Qh, c, strip_cols, cdtype)
+            for n in range(len(D0_values))
+        ]
+        for k, start in enumerate(range(0, Qh, strip_cols)):
+            stop = min(start + strip_cols, Qh)
+            F = fft(rows_fft[k, :, :stop - start], n=P, axis=0)
+            for D0, out in zip(D0_values, filtered_fft):
+                W = transfer_strip(shape, ref_shape, np.arange(start, stop), filter_type, D0, D0_low, D0_high, F.real.dtype)
+                out[k, :, :stop - start] = ifft(F * W[:, :, np.newaxis], axis=0)[:a]
+            del F
+
+        # Pass 3: gather each strip of rows from the blocks, inverse real FFT it, crop to b
+        # columns and clip
+        filtered_images = []
+        gathered = np.empty((strip_rows, rows_fft.shape[0] * strip_cols, c), dtype=cdtype)
+        for D0, out in zip(D0_values, filtered_fft):
+            file_path = os.path.join(out_dir, f"{filter_spec(filter_type, D0, D0_low, D0_high)}.npy")
+            F1 = open_memmap(file_path, mode='w+', dtype=dtype, shape=A.shape)
+            for start in range(0, a, strip_rows):
+                stop = min(start + strip_rows, a)
+                rows = gathered[:stop - start]
+                gather_rows(out, start, rows)
+                strip = irfft(rows[:, :Qh], n=Q, axis=1)[:, :b]
+                F1[start:stop] = np.clip(strip, 0, 1).reshape(F1[start:stop].shape)
+            F1.flush()
+            filtered_images.append((F1, filter_type, D0, D0_low, D0_high))
+
+        # Release the scratch maps before the directory is removed (required on Windows)
+        rows_fft = filtered_fft = out = None
+    return filtered_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Filter an .npy raster larger than memory with an exact out-of-core FFT.')
+    parser.add_argument('image', help='(a, b) or (a, b, c) .npy file, read memory-mapped')
+    parser.add_argument('--filter', dest='filter_type', choices=['highpass', 'lowpass', 'bandpass'], default='lowpass')
+    parser.add_argument('--D0', type=float, nargs='+', default=[3, 5])
+    parser.add_argument('--D0-low', type=float)
+    parser.add_argument('--D0-high', type=float)
+    parser.add_argument('--out-dir', default='./result_imgs')
+    parser.add_argument('--scratch-dir', default=None, help='Where to put scratch files (default: system temp)')
+    parser.add_argument('--strip-mb', type=int, default=64, help='Working set per strip in MiB')
+    parser.add_argument('--float32', action='store_true', help='Compute in single precision')
+    parser.add_argument('--padding', choices=['double', 'zero'], default='double')
+    args = parser.parse_args()
+
+    filtered_images = ooc_filter(args.image, args.D0, args.filter_type, args.D0_low, args.D0_high, args.out_dir,
+                                 args.scratch_dir, args.strip_mb * 1024**2,
+                                 np.float32 if args.float32 else np.float64, args.padding)
+    for F1, filter_type, D0, D0_low, D0_high in filtered_images or []:
+        print(f"Saved: {F1.filename}")
+
+if __name__ == "__main__":
+    main()
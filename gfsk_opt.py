@@ -1,9 +1,10 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.fft import fft2, ifft2, fftshift, ifftshift
-from skimage import io, img_as_float
+from scipy.fft import rfft2, irfft2, next_fast_len
 from tkinter import Tk, filedialog
+from gfsk_cache import SpectrumCache
+from gfsk_io import read_image, save_result
 
 
 def select_image():
@@ -14,72 +15,205 @@ def select_image():
     root.destroy()
     return file_path
 
-def load_image(image_path):
+def load_image(image_path, dtype=np.float64):
     """Function to load an image and convert grayscale to RGB if necessary."""
     try:
-        A = img_as_float(io.imread(image_path))
-        if A.ndim == 2:
+        A, source = read_image(image_path, dtype)
+        if source.grayscale:
             print("Grayscale image loaded. Converting to RGB.")
-            A = np.stack((A, A, A), axis=-1)  # Convert grayscale to RGB by stacking channels
-        return A
+        return A, source
     except Exception as e:
         print(f"Error loading the image: {e}")
+        return None, None
+
+PADDING_MODES = ('double', 'zero', 'reflect', 'symmetric')
+
+def gaussian_transfer(shape, filter_type, D0, D0_low=None, D0_high=None, dtype=np.float64, ref_shape=None):
+    """Function to build the Gaussian transfer function for a padded shape in rfft2 layout.
+
+    D0 is measured in frequency bins of ref_shape, which defaults to shape. Halo padding
+    passes the (2*a, 2*b) grid here so a cutoff means the same as with doubled padding.
+    dtype sets the kernel precision; integer dtypes give at least float32.
+    """
+    P, Q = shape
+    ref_P, ref_Q = ref_shape or shape
+    # Always a float grid: the indices are signed, and an integer image dtype only sets the
+    # precision of the kernel, never of its frequencies
+    dtype = np.result_type(dtype, np.float32)
+    # Frequency indices in FFT order: same distances as the centred np.mgrid[-a:a, -b:b] grid
+    u = (np.fft.fftfreq(P, 1.0 / P) * (ref_P / P)).astype(dtype)
+    v = (np.arange(Q // 2 + 1) * (ref_Q / Q)).astype(dtype)
+    D_square = u[:, np.newaxis]**2 + v[np.newaxis, :]**2
+    if filter_type == 'highpass':
+        W = 1 - np.exp(-D_square / (2 * D0**2))
+    elif filter_type == 'lowpass':
+        W = np.exp(-D_square / (2 * D0**2))
+    elif filter_type == 'bandpass':
+        W_low = np.exp(-D_square / (2 * D0_low**2))
+        W_high = np.exp(-D_square / (2 * D0_high**2))
+        W = W_high - W_low
+    else:
+        raise ValueError(f"Unknown filter type: {filter_type}")
+    return W.astype(dtype, copy=False)
+
+def smallest_cutoff(filter_type, D0_values, D0_low=None, D0_high=None):
+    """Function to find the cutoff with the widest spatial kernel among the requested filters."""
+    if filter_type == 'bandpass':
+        return min(D0_low, D0_high)
+    return min(D0_values)
+
+def halo_width(length, D0, tol=1e-3):
+    """Function to compute how far the spatial kernel of cutoff D0 reaches along an axis of `length` pixels.
+
+    With D0 in bins of the doubled (2 * length) grid, the kernel is a Gaussian with
+    sigma = length / (pi * D0) pixels; past the returned width it has decayed below tol
+    of its peak. High-pass is a delta minus the low-pass kernel, so it reaches as far.
+    """
+    sigma = length / (np.pi * D0)
+    return int(np.ceil(sigma * np.sqrt(-2 * np.log(tol))))
+
+def padding_geometry(a, b, D0_min, padding='double', tol=1e-3):
+    """Function to choose the padded FFT shape and where the image sits inside it.
+
+    'double' pads to (2*a, 2*b). 'zero' only adds the kernel halo of zeros after the image,
+    which also covers the wrap-around before it. 'reflect' and 'symmetric' put a halo of
+    mirrored border on both sides. The halo shapes are rounded up to sizes the FFT is fast
+    for and never exceed the doubled shape: a mirrored halo is capped at half the image,
+    with a warning that the kernel then reaches beyond tol. Returns (shape, (top, left)).
+    """
+    if padding not in PADDING_MODES:
+        raise ValueError(f"Unknown padding mode: {padding}")
+    if padding == 'double':
+        return (2*a, 2*b), (0, 0)
+
+    halo_a, halo_b = halo_width(a, D0_min, tol), halo_width(b, D0_min, tol)
+    if padding == 'zero':
+        return (min(next_fast_len(a + halo_a, real=True), 2*a), min(next_fast_len(b + halo_b, real=True), 2*b)), (0, 0)
+    if halo_a > a // 2 or halo_b > b // 2:
+        print(f"Warning: D0={D0_min} needs a {halo_a}x{halo_b} halo; capping {padding} padding at half the image")
+        halo_a, halo_b = min(halo_a, a // 2), min(halo_b, b // 2)
+    return (min(next_fast_len(a + 2*halo_a, real=True), 2*a), min(next_fast_len(b + 2*halo_b, real=True), 2*b)), (halo_a, halo_b)
+
+def pad_image(A, shape, offset, padding, axes=(0, 1)):
+    """Function to pad an image (or stack) to the FFT shape; zero modes are left to the FFT's own zero-padding."""
+    if padding in ('double', 'zero'):
+        return A
+    pad_width = [(0, 0)] * A.ndim
+    for axis, size, before in zip(axes, shape, offset):
+        pad_width[axis] = (before, size - A.shape[axis] - before)
+    return np.pad(A, pad_width, mode=padding)
+
+def filter_spec(filter_type, D0, D0_low=None, D0_high=None):
+    """Function to describe a filter the same way save_image names its output."""
+    if filter_type == 'bandpass':
+        return f"{filter_type}_D0_low_{D0_low}_D0_high_{D0_high}"
+    return f"{filter_type}_D0_{D0}"
+
+def filter_image(A, D0_values, filter_type='highpass', D0_low=None, D0_high=None, cache=None, workers=None, padding='double', tol=1e-3):
+    """Function to filter an image in the frequency domain and return the clipped results.
+
+    The spectrum is computed at most once for all D0 values. When a SpectrumCache is given,
+    the forward spectrum and every filtered output are looked up there first, so a sweep that
+    only adds a new D0 computes just the new output. See padding_geometry for the padding
+    modes; the halo modes are sized for the smallest cutoff requested.
+    """
+    if A is None or D0_values is None:
+        return None
+    if filter_type == 'bandpass' and (D0_low is None or D0_high is None):
+        print("D0_low and D0_high must be provided for bandpass filter")
         return None
 
-def fft_filter(A, D0_values, filter_type='highpass', D0_low=None, D0_high=None):
+    [a, b, c] = A.shape
+    # Zero-pad (or mirror) enough to avoid circular wrap-around
+    D0_min = smallest_cutoff(filter_type, D0_values, D0_low, D0_high)
+    shape, (top, left) = padding_geometry(a, b, D0_min, padding, tol)
+    key = cache.image_key(A, shape, f"{padding}_{top}_{left}") if cache is not None else None
+
+    F = None
+    filtered_images = []
+    for D0 in D0_values:
+        spec = filter_spec(filter_type, D0, D0_low, D0_high)
+        F1 = cache.load_result(key, spec) if cache is not None else None
+        if F1 is None:
+            if F is None:
+                F = cache.load_spectrum(key) if cache is not None else None
+            if F is None:
+                # Real input: the half spectrum holds everything the inverse needs
+                F = rfft2(pad_image(A, shape, (top, left), padding), s=shape, axes=(0, 1), workers=workers)
+                if cache is not None:
+                    cache.save_spectrum(key, F)
+
+            # Apply filter in the frequency domain for each channel
+            # Build the kernel in the input precision so float32 stays float32 throughout
+            W = gaussian_transfer(shape, filter_type, D0, D0_low, D0_high, dtype=F.real.dtype, ref_shape=(2*a, 2*b))
+            G = F * W[:, :, np.newaxis]
+            F1 = irfft2(G, s=shape, axes=(0, 1), workers=workers)[top:top + a, left:left + b, :]
+
+            # Clip filtered image values to [0, 1] range
+            F1 = np.clip(F1, 0, 1)
+            if cache is not None:
+                cache.save_result(key, spec, F1)
+
+        filtered_images.append((F1, filter_type, D0, D0_low, D0_high))
+
+    return filtered_images
+
+def forward_stack(stack, workers=None, shape=None, offset=(0, 0), padding='double'):
+    """Function to compute the half spectra of a stack of same-shaped (N, a, b, c) images.
+
+    Each spectrum F[n] is what filter_image computes (and caches) for that image alone.
+    """
+    [n, a, b, c] = stack.shape
+    shape = shape or (2*a, 2*b)
+    return rfft2(pad_image(stack, shape, offset, padding, axes=(1, 2)), s=shape, axes=(1, 2), workers=workers)
+
+def inverse_stack(F, W, image_shape, workers=None, shape=None, offset=(0, 0)):
+    """Function to apply one transfer function to a stack of half spectra and return the clipped (N, a, b, c) images."""
+    a, b = image_shape[:2]
+    shape = shape or (2*a, 2*b)
+    top, left = offset
+    # Trailing channel axis broadcasts the transfer over the colour channels
+    G = F * W.astype(F.real.dtype, copy=False)[..., np.newaxis]
+    F1 = irfft2(G, s=shape, axes=(1, 2), workers=workers)[:, top:top + a, left:left + b, :]
+    return np.clip(F1, 0, 1)
+
+def filter_stack(stack, transfers, workers=None, shape=None, offset=(0, 0), padding='double'):
+    """Function to filter a stack of same-shaped images with one batched forward and inverse FFT per transfer.
+
+    stack has shape (N, a, b, c). shape and offset come from padding_geometry and default to
+    doubled padding. Each transfer comes from gaussian_transfer for that padded shape and is
+    either shared by the whole stack, shape (P, Q//2 + 1), or given per image, shape
+    (N, P, Q//2 + 1). Returns one clipped (N, a, b, c) array per transfer.
+    """
+    F = forward_stack(stack, workers, shape, offset, padding)
+    return [inverse_stack(F, W, stack.shape[1:], workers, shape, offset) for W in transfers]
+
+def fft_filter(A, D0_values, filter_type='highpass', D0_low=None, D0_high=None, cache=None, source=None, padding='double', tol=1e-3):
     """Function to perform frequency domain filtering on an image."""
-    if A is None or D0_values is None:
+    filtered_images = filter_image(A, D0_values, filter_type, D0_low, D0_high, cache=cache, padding=padding, tol=tol)
+    if filtered_images is None:
         return None
 
-    [a, b, c] = A.shape
     fig, axs = plt.subplots(2, 2, figsize=(10, 10))
     axs[0, 0].imshow(A.clip(0, 1))  # Clip values to [0, 1] range
     axs[0, 0].set_title('Original Image')
 
-    # Perform 2D FFT for each color channel with zero-padding
-    F = fft2(A, s=(2*a, 2*b), axes=(0, 1))
-    F3 = fftshift(F, axes=(0, 1))
-
-    for idx, D0 in enumerate(D0_values, start=1):
-        W = np.zeros((2*a, 2*b, c))
-        u, v = np.mgrid[-a:a, -b:b]  # Use NumPy indexing for performance
-        D_square = (u)**2 + (v)**2
-        if filter_type == 'highpass':
-            W[:, :, :] = 1 - np.exp(-D_square[:, :, np.newaxis] / (2 * D0 **2))
-        elif filter_type == 'lowpass':
-            W[:, :, :] = np.exp(-D_square[:, :, np.newaxis] / (2 * D0**2))
-        elif filter_type == 'bandpass':
-            if D0_low is None or D0_high is None:
-                print("D0_low and D0_high must be provided for bandpass filter")
-                return None
-            W_low = np.exp(-D_square[:, :, np.newaxis] / (2 * D0_low**2))
-            W_high = np.exp(-D_square[:, :, np.newaxis] / (2 * D0_high**2))
-            W[:, :, :] = W_high - W_low
-
-        # Apply filter in the frequency domain for each channel
-        G = F3 * W
-        F4 = ifftshift(G, axes=(0, 1))
-        F1 = ifft2(F4, axes=(0, 1))
-        F1 = np.real(F1[:a, :b, :])
-
-        # Clip filtered image values to [0, 1] range
-        F1 = np.clip(F1, 0, 1)
-
+    for idx, (F1, filter_type, D0, D0_low, D0_high) in enumerate(filtered_images, start=1):
         # Display the filtered image
         row, col = divmod(idx, 2)
         axs[row, col].imshow(F1)
         if filter_type == 'highpass':
             axs[row, col].set_title(f'High-Pass Filter D0={D0}')
-            file_name = f'HighPassFiltered_D0_{D0}.png'
+            file_name = f'HighPassFiltered_D0_{D0}'
         elif filter_type == 'lowpass':
             axs[row, col].set_title(f'Low-Pass Filter D0={D0}')
-            file_name = f'LowPassFiltered_D0_{D0}.png'
+            file_name = f'LowPassFiltered_D0_{D0}'
         elif filter_type == 'bandpass':
             axs[row, col].set_title(f'Band-Pass Filter D0_low={D0_low}, D0_high={D0_high}')
-            file_name = f'BandPassFiltered_D0_low_{D0_low}_D0_high_{D0_high}.png'
-        
-        file_path = os.path.join("./", file_name)
-        plt.imsave(file_path, F1)
+            file_name = f'BandPassFiltered_D0_low_{D0_low}_D0_high_{D0_high}'
+
+        # Written in the source's format and bit depth
+        save_result(os.path.join("./", file_name), F1, source)
 
     plt.tight_layout()
     plt.show()
@@ -95,22 +229,25 @@ def main():
         print("No image selected. Exiting.")
         return
 
-    A = load_image(image_path)
+    A, source = load_image(image_path)
     if A is None:
         return
 
     # Define filter cutoff frequencies
     D0_values = [3, 10, 20]
 
+    # Reuse spectra and outputs from earlier runs on the same image
+    cache = SpectrumCache()
+
     # Perform FFT high-pass, low-pass, and band-pass filtering and display results
     filter_types = ['highpass', 'lowpass']
     for filter_type in filter_types:
-        fft_filter(A, D0_values, filter_type)
+        fft_filter(A, D0_values, filter_type, cache=cache, source=source)
 
     # Bandpass filter example
     D0_low = 3
     D0_high = 10
-    fft_filter(A, [10], 'bandpass', D0_low=D0_low, D0_high=D0_high)
+    fft_filter(A, [10], 'bandpass', D0_low=D0_low, D0_high=D0_high, cache=cache, source=source)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,331 @@
+import os
+import sys
+import math
+import argparse
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import gfsk_opt
+import gfsk_Block
+from gfsk_io import save_result
+
+Plan = namedtuple('Plan', ['engine', 'dtype', 'block_size', 'overlap', 'border_size', 'batch_tiles',
+                           'workers', 'jobs', 'peak_bytes', 'cost'])
+
+# The filter bank the interactive scripts run: (filter_type, D0_values, D0_low, D0_high)
+DEFAULT_BANK = [
+    ('highpass', [5, 10, 20], None, None),
+    ('lowpass', [20, 10, 5], None, None),
+    ('bandpass', [10], 5, 10),
+    ('bandpass', [10], 10, 30),
+    ('bandpass', [10], 5, 30),
+]
+
+TILE_SIZES = (128, 256, 512, 1024)
+# FFT plan caches and thread stacks that any run adds to the process
+RUNTIME_OVERHEAD = 16 * 1024**2
+# Freed temporaries that malloc keeps resident, worst with one arena per worker thread
+TRANSIENT_SLACK = 1.3
+PRECISION_SPEED = {'float32': 0.6, 'float64': 1.0}
+
+
+def parse_bytes(text):
+    """Function to parse a size such as 512M, 4G or 1.5GiB into bytes."""
+    text = text.strip().upper().rstrip('IB').rstrip('B')
+    units = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+def format_bytes(n):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+def fft_work(P, Q, count):
+    """Function to give the relative cost of `count` real 2-D FFTs of a P x Q grid."""
+    return count * P * Q * math.log2(max(P * Q, 2)) / 2
+
+def speedup(cpus, jobs, workers):
+    # Independent jobs scale better than the threads inside one FFT call
+    outer = min(cpus, jobs)
+    inner = min(cpus, jobs * workers) - outer
+    return max(1.0, 0.95 * outer + 0.6 * inner)
+
+
+def estimate_whole(shape, bank, dtype, jobs):
+    """Function to estimate peak bytes and cost of gfsk_opt.filter_image over the bank.
+
+    Every clipped output of the bank is kept until the end. On top of that, each running job
+    holds the half spectrum F, the filtered spectrum, the complex intermediate of the inverse
+    transform and its uncropped real output (about 4 F together) and three transfer-sized
+    temporaries while the kernel is built.
+    """
+    a, b, c = shape
+    itemsize = np.dtype(dtype).itemsize
+    P, Q = 2*a, 2*b
+    W = P * (Q//2 + 1) * itemsize
+    F = 2 * W * c
+    O = a * b * c * itemsize
+    outputs = sum(len(D0_values) for _, D0_values, _, _ in bank)
+    peak = int(O * (1 + outputs) + jobs * (4*F + 3*W) * TRANSIENT_SLACK + RUNTIME_OVERHEAD)
+    work = sum(fft_work(P, Q, c * (1 + len(D0_values))) for _, D0_values, _, _ in bank)
+    return peak, work * PRECISION_SPEED[dtype]
+
+def estimate_stack(shape, n_images, n_outputs, dtype):
+    """Function to estimate the peak bytes of gfsk_opt.filter_stack on n_images images of one shape.
+
+    That is the stacked input, its half spectrum F, the filtered spectrum and the inverse
+    transform's temporaries (one more F while the previous product is still referenced)
+    and the clipped output stacks.
+    """
+    a, b, c = shape
+    itemsize = np.dtype(dtype).itemsize
+    F = n_images * 2*a * (b + 1) * c * 2 * itemsize
+    O = n_images * a * b * c * itemsize
+    return O + (4 if n_outputs > 1 else 3) * F + n_outputs * O
+
+def estimate_tiled(shape, bank, dtype, jobs, block_size, overlap, border_size, batch_tiles, workers):
+    """Function to estimate peak bytes and cost of gfsk_Block.fft_filter over the bank.
+
+    Every output of the bank is a view that keeps its bordered buffer alive until the end.
+    On top of that, each running job holds the bordered copy of the image, its kernels, and
+    for each busy worker one batch of tiles: the stacked tiles, their half spectra (about 4 F
+    while filtering, as in estimate_whole) and the clipped tile outputs for every D0.
+    """
+    a, b, c = shape
+    itemsize = np.dtype(dtype).itemsize
+    a_padded, b_padded = a + 2*border_size, b + 2*border_size
+    rows = gfsk_Block.tile_ranges(a_padded, block_size, overlap)
+    cols = gfsk_Block.tile_ranges(b_padded, block_size, overlap)
+    groups = {}
+    for row in rows:
+        for col in cols:
+            key = (row[1] - row[0], col[1] - col[0])
+            groups[key] = groups.get(key, 0) + 1
+    batches = sorted(
+        ((bi, bj, min(batch_tiles, count - start)) for (bi, bj), count in groups.items()
+         for start in range(0, count, batch_tiles)),
+        key=lambda batch: -batch[0] * batch[1] * batch[2])
+
+    image = a_padded * b_padded * c * itemsize
+    outputs = sum(len(D0_values) for _, D0_values, _, _ in bank)
+    per_job = 0
+    work = 0
+    for _, D0_values, _, _ in bank:
+        n = len(D0_values)
+        busy = sum(
+            4 * N * 2*bi * (bj + 1) * c * 2 * itemsize + (1 + n) * N * bi * bj * c * itemsize
+            for bi, bj, N in batches[:workers])
+        kernels = sum(n * 2*bi * (bj + 1) * itemsize for bi, bj in groups)
+        per_job = max(per_job, image + busy + kernels)
+        work += sum(count * fft_work(2*bi, 2*bj, c * (1 + n)) for (bi, bj), count in groups.items())
+    peak = int(a * b * c * itemsize + outputs * image + jobs * per_job * TRANSIENT_SLACK + RUNTIME_OVERHEAD)
+    return peak, work * PRECISION_SPEED[dtype]
+
+def estimate_gpu(shape, bank, jobs):
+    """Function to estimate host peak bytes and cost of the float32 torch path in gfsk_GPU."""
+    a, b, c = shape
+    cuda = gpu_available() == 'cuda'
+    O = a * b * c * 4
+    outputs = sum(len(D0_values) for _, D0_values, _, _ in bank)
+    # On the CPU fallback torch holds the full complex spectrum of one channel several times
+    transient = 0 if cuda else 5 * (2*a) * (2*b) * 8
+    peak = int(a * b * c * 8 + outputs * O + jobs * (O + transient) * TRANSIENT_SLACK + RUNTIME_OVERHEAD)
+    work = sum(2 * fft_work(2*a, 2*b, c * (1 + len(D0_values))) for _, D0_values, _, _ in bank)
+    return peak, work * (0.05 if cuda else 1.0)
+
+def gpu_available():
+    """Function to report 'cuda', 'cpu' or None depending on what torch can offer."""
+    try:
+        import torch
+    except ImportError:
+        return None
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+def candidate_plans(shape, bank, cpus=None, precisions=('float32', 'float64'), overlap=50, border_size=50):
+    """Function to list every strategy with its estimated peak bytes and relative cost."""
+    cpus = cpus or os.cpu_count() or 1
+    plans = []
+    for jobs in sorted({1, min(len(bank), cpus), len(bank)}):
+        workers = max(1, cpus // jobs)
+        parallel = speedup(cpus, jobs, workers)
+        for dtype in precisions:
+            peak, work = estimate_whole(shape, bank, dtype, jobs)
+            plans.append(Plan('whole', dtype, None, None, None, None, workers, jobs, peak, work / parallel))
+            for block_size in TILE_SIZES:
+                if block_size <= overlap or block_size >= max(shape[:2]) + 2 * border_size:
+                    continue
+                for batch_tiles in (4, 32):
+                    peak, work = estimate_tiled(shape, bank, dtype, jobs, block_size, overlap, border_size, batch_tiles, workers)
+                    plans.append(Plan('tiled', dtype, block_size, overlap, border_size, batch_tiles,
+                                      workers, jobs, peak, work / parallel))
+        if gpu_available() and 'float32' in precisions:
+            peak, work = estimate_gpu(shape, bank, jobs)
+            plans.append(Plan('gpu', 'float32', None, None, None, None, workers, jobs, peak, work / min(jobs, cpus)))
+    return plans
+
+def choose_plan(shape, bank, max_memory, **kwargs):
+    """Function to pick the fastest plan whose estimated peak fits in max_memory.
+
+    Whole-image plans are exact, while tiling only approximates the global filter, so tiled
+    plans are considered only when no whole-image plan fits. Returns (plan, candidates),
+    with plan None when nothing fits.
+    """
+    candidates = candidate_plans(shape, bank, **kwargs)
+    fitting = [plan for plan in candidates if plan.peak_bytes <= max_memory]
+    exact = [plan for plan in fitting if plan.engine != 'tiled']
+    pool = exact or fitting
+    plan = min(pool, key=lambda plan: plan.cost) if pool else None
+    return plan, candidates
+
+def describe(plan):
+    text = f"{plan.engine} {plan.dtype}, {plan.jobs} concurrent job(s) x {plan.workers} worker(s)"
+    if plan.engine == 'tiled':
+        text += f", block_size={plan.block_size} overlap={plan.overlap} border_size={plan.border_size} batch_tiles={plan.batch_tiles}"
+    return text
+
+def explain(plan, candidates, max_memory):
+    """Function to explain which plan was chosen and how the alternatives compared."""
+    lines = [f"Memory budget: {format_bytes(max_memory)}"]
+    if plan is None:
+        smallest = min(candidates, key=lambda candidate: candidate.peak_bytes)
+        lines.append(f"No plan fits. The smallest is {describe(smallest)} at {format_bytes(smallest.peak_bytes)}.")
+        return "\n".join(lines)
+
+    fastest = min(candidates, key=lambda candidate: candidate.cost)
+    lines.append(f"Chosen: {describe(plan)}, estimated peak {format_bytes(plan.peak_bytes)}, relative time {plan.cost / fastest.cost:.2f}")
+    if plan.engine == 'tiled':
+        lines.append("No exact whole-image plan fits the budget, so the image is tiled.")
+    elif fastest is not plan:
+        lines.append(f"The fastest overall, {describe(fastest)}, needs {format_bytes(fastest.peak_bytes)}.")
+    lines.append("Candidates:")
+    for candidate in sorted(candidates, key=lambda candidate: candidate.cost):
+        fits = 'fits' if candidate.peak_bytes <= max_memory else 'too big'
+        lines.append(f"  {describe(candidate):90s} {format_bytes(candidate.peak_bytes):>12s}  x{candidate.cost / fastest.cost:6.2f}  {fits}")
+    return "\n".join(lines)
+
+
+def execute(plan, A, filter_type, D0_values, D0_low=None, D0_high=None):
+    """Function to run one filter of the bank with the chosen plan and return the filtered images."""
+    A = A.astype(plan.dtype, copy=False)
+    if plan.engine == 'whole':
+        return gfsk_opt.filter_image(A, D0_values, filter_type, D0_low, D0_high, workers=plan.workers)
+    if plan.engine == 'tiled':
+        return gfsk_Block.fft_filter(A, D0_values, filter_type, D0_low, D0_high, plan.block_size, plan.overlap,
+                                     plan.border_size, workers=plan.workers, batch_tiles=plan.batch_tiles, save=False)
+    import gfsk_GPU
+    return gfsk_GPU.fft_filter(A, D0_values, filter_type, D0_low, D0_high, workers=plan.workers, save=False)
+
+def run_bank(plan, A, bank):
+    """Function to run every filter of the bank, plan.jobs at a time."""
+    with ThreadPoolExecutor(max_workers=plan.jobs) as executor:
+        futures = [executor.submit(execute, plan, A, *entry) for entry in bank]
+        return [future.result() for future in futures]
+
+def save_bank(filtered_banks, out_dir='./result_imgs', source=None):
+    """Function to write every output of run_bank to out_dir, named like the scripts' save_image."""
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for filtered_images in filtered_banks:
+        for F1, filter_type, D0, D0_low, D0_high in filtered_images or []:
+            file_stem = os.path.join(out_dir, gfsk_opt.filter_spec(filter_type, D0, D0_low, D0_high))
+            written.append(save_result(file_stem, F1, source))
+    return written
+
+def max_rss():
+    """Function to give this process's peak resident set size in bytes."""
+    import resource  # POSIX only
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux reports KiB
+
+def current_rss():
+    """Function to give this process's resident set size now, in bytes, or its peak where /proc is missing."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return max_rss()
+
+def peak_rss():
+    """Function to give the peak resident set size of this process's own address space, in bytes.
+
+    ru_maxrss of a spawned child starts at the parent's resident size from before exec,
+    VmHWM does not; falls back to max_rss() where /proc is missing.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return max_rss()
+
+def _measure_child(plan, shape, bank, seed, conn):
+    A = np.random.default_rng(seed).random(shape, dtype=plan.dtype)
+    base = current_rss()  # Not the peak: imports would hide part of the growth
+    run_bank(plan, A, bank)
+    conn.send(peak_rss() - base + A.nbytes)  # The image itself is part of every estimate
+    conn.close()
+
+def measure_peak(plan, shape, bank, seed=0):
+    """Function to run the bank on a random image of `shape` and return its measured peak bytes.
+
+    The run happens in a freshly spawned process, so the peak resident set size covers
+    everything the plan really touches (FFT scratch buffers and torch included) and is not
+    raised by whatever ran before in this process.
+    """
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure_child, args=(plan, shape, bank, seed, sender))
+    process.start()
+    sender.close()
+    try:
+        peak = receiver.recv()
+    except EOFError:
+        peak = None  # The child died before reporting
+    process.join()
+    if peak is None:
+        raise RuntimeError(f"Measuring {describe(plan)} failed with exit code {process.exitcode}")
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pick an engine, precision and tiling that fit a memory budget.')
+    parser.add_argument('image', help='Image to plan for')
+    parser.add_argument('--max-memory', required=True, help='Budget such as 512M or 4G')
+    parser.add_argument('--precision', choices=['float32', 'float64'], help='Only consider this precision')
+    parser.add_argument('--cpus', type=int, default=None)
+    parser.add_argument('--out-dir', default='./result_imgs', help='Where to write the filtered images')
+    parser.add_argument('--dry-run', action='store_true', help='Only explain the plan, do not run it')
+    parser.add_argument('--verify', action='store_true', help='Also measure the plan\'s peak RSS on a random image of the same shape')
+    args = parser.parse_args()
+
+    max_memory = parse_bytes(args.max_memory)
+    precisions = (args.precision,) if args.precision else ('float32', 'float64')
+    A, source = gfsk_opt.load_image(args.image, dtype=np.float32 if precisions == ('float32',) else np.float64)
+    if A is None:
+        return
+
+    plan, candidates = choose_plan(A.shape, DEFAULT_BANK, max_memory, cpus=args.cpus, precisions=precisions)
+    print(explain(plan, candidates, max_memory))
+    if plan is None or args.dry_run:
+        return
+    if args.verify:
+        peak = measure_peak(plan, A.shape, DEFAULT_BANK)
+        print(f"Measured peak {format_bytes(peak)} vs estimated {format_bytes(plan.peak_bytes)}")
+
+    if A.dtype != plan.dtype:
+        # Decode again in the plan's precision rather than holding both copies
+        del A
+        A, source = gfsk_opt.load_image(args.image, dtype=plan.dtype)
+    written = save_bank(run_bank(plan, A, DEFAULT_BANK), args.out_dir, source)
+    print(f"Wrote {len(written)} images to {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.widgets import Slider
+from concurrent.futures import ThreadPoolExecutor
+from scipy.fft import rfft2, irfft2
+from gfsk_opt import gaussian_transfer
+
+
+def decimate(A, factor):
+    """Function to shrink an image by averaging factor x factor pixel blocks."""
+    if factor == 1:
+        return A
+    [a, b, c] = A.shape
+    a_small, b_small = a // factor, b // factor
+    blocks = A[:a_small * factor, :b_small * factor].reshape(a_small, factor, b_small, factor, c)
+    return blocks.mean(axis=(1, 3))
+
+def preview_factor(shape, max_side=512):
+    """Function to pick the decimation factor that brings the longer side down to max_side."""
+    return max(1, -(-max(shape[:2]) // max_side))
+
+
+class ProgressivePreview:
+    """Filters an image at preview resolution first and at full resolution on request.
+
+    D0 is measured in frequency bins of the zero-padded grid. A bin of the decimated grid
+    covers the same number of cycles per image as the corresponding bin of the full grid,
+    so the cutoffs carry over to the preview unchanged. The forward spectrum of each
+    resolution is computed once, so changing D0 costs a single inverse FFT.
+    """
+
+    def __init__(self, A, max_side=512, workers=None):
+        self.A = A
+        self.factor = preview_factor(A.shape, max_side)
+        self.small = decimate(A, self.factor)
+        self.workers = workers
+        self._spectra = {}
+
+    def _filter(self, level, image, filter_type, D0, D0_low, D0_high):
+        [a, b, c] = image.shape
+        shape = (2*a, 2*b)
+        if level not in self._spectra:
+            self._spectra[level] = rfft2(image, s=shape, axes=(0, 1), workers=self.workers)
+        W = gaussian_transfer(shape, filter_type, D0, D0_low, D0_high, dtype=image.dtype)
+        F1 = irfft2(self._spectra[level] * W[:, :, np.newaxis], s=shape, axes=(0, 1), workers=self.workers)
+        return np.clip(F1[:a, :b, :], 0, 1)
+
+    def preview(self, filter_type, D0=None, D0_low=None, D0_high=None):
+        """Function to filter the decimated copy of the image."""
+        return self._filter('preview', self.small, filter_type, D0, D0_low, D0_high)
+
+    def full(self, filter_type, D0=None, D0_low=None, D0_high=None):
+        """Function to filter the image at full resolution."""
+        return self._filter('full', self.A, filter_type, D0, D0_low, D0_high)
+
+
+def show_preview_pages(A, pages, preview):
+    """Function to draw each page of filters from the preview so figures appear immediately.
+
+    pages is a list of pages, each a list of (title, filter_type, D0, D0_low, D0_high).
+    Returns a dict mapping (filter_type, D0, D0_low, D0_high) to the AxesImage to refine.
+    """
+    images = {}
+    original = A.clip(0, 1)[::preview.factor, ::preview.factor]
+    for page in pages:
+        fig, axs = plt.subplots(2, 2, figsize=(10, 7.2))
+        axs[0, 0].imshow(original)
+        axs[0, 0].set_title('Original Image')
+        for idx, (title, filter_type, D0, D0_low, D0_high) in enumerate(page[:3], start=1):
+            row, col = divmod(idx, 2)
+            images[(filter_type, D0, D0_low, D0_high)] = axs[row, col].imshow(
+                preview.preview(filter_type, D0, D0_low, D0_high))
+            axs[row, col].set_title(title)
+        plt.tight_layout()
+        plt.show(block=False)
+    plt.pause(0.001)  # Let the GUI draw the previews before full resolution work starts
+    return images
+
+def filter_pages(lowpass_D0_values, highpass_D0_values, bandpass_D0_values, bandpass_D0=10):
+    """Function to lay out the low-pass, high-pass and band-pass pages the way the main scripts do."""
+    return [
+        [(f'Low-Pass Filter D0={D0}', 'lowpass', D0, None, None) for D0 in lowpass_D0_values],
+        [(f'High-Pass Filter D0={D0}', 'highpass', D0, None, None) for D0 in highpass_D0_values],
+        [(f'Band-Pass Filter D0_low={D0_low}, D0_high={D0_high}', 'bandpass', bandpass_D0, D0_low, D0_high)
+         for D0_low, D0_high in bandpass_D0_values],
+    ]
+
+def refine_pages(images, filtered_images):
+    """Function to swap preview images for the full resolution results once they are ready."""
+    for F1, filter_type, D0, D0_low, D0_high in filtered_images:
+        image = images.get((filter_type, D0, D0_low, D0_high))
+        if image is not None:
+            image.set_data(F1)
+            image.figure.canvas.draw_idle()
+
+def refine_from_queues(images, threads, queues):
+    """Function to refine previews as each filter thread delivers, keeping the figures responsive."""
+    while any(t.is_alive() for t in threads) or not all(q.empty() for q in queues):
+        for q in queues:
+            while not q.empty():
+                refine_pages(images, q.get())
+        plt.pause(0.05)
+
+
+def tune(A, filter_type='lowpass', D0=10, D0_range=(1, 100), max_side=512):
+    """Function to tune D0 interactively with a slider.
+
+    Every slider move redraws the preview at once; the full resolution result replaces it
+    when the background worker finishes, unless the slider has moved on in the meantime.
+    """
+    preview = ProgressivePreview(A, max_side)
+    executor = ThreadPoolExecutor(max_workers=1)
+    pending = {}
+
+    fig, ax = plt.subplots(figsize=(8, 8))
+    plt.subplots_adjust(bottom=0.15)
+    image = ax.imshow(preview.preview(filter_type, D0))
+    ax.set_title(f'{filter_type} D0={D0} (preview)')
+    slider = Slider(plt.axes([0.15, 0.05, 0.7, 0.03]), 'D0', D0_range[0], D0_range[1], valinit=D0)
+
+    def on_change(value):
+        image.set_data(preview.preview(filter_type, value))
+        ax.set_title(f'{filter_type} D0={value:.1f} (preview)')
+        if 'future' in pending:
+            pending['future'].cancel()  # Skip stale full resolution work that has not started
+        pending['D0'] = value
+        pending['future'] = executor.submit(preview.full, filter_type, value)
+        fig.canvas.draw_idle()
+
+    def poll():
+        future = pending.get('future')
+        if future is not None and future.done():
+            del pending['future']
+            image.set_data(future.result())
+            ax.set_title(f"{filter_type} D0={pending['D0']:.1f}")
+            fig.canvas.draw_idle()
+
+    slider.on_changed(on_change)
+    timer = fig.canvas.new_timer(interval=50)
+    timer.add_callback(poll)
+    timer.start()
+    on_change(D0)
+    plt.show()
+    executor.shutdown(wait=False)
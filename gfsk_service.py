@@ -0,0 +1,281 @@
+import io
+import json
+import asyncio
+import argparse
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from gfsk_opt import gaussian_transfer, filter_stack
+
+FILTER_TYPES = ('highpass', 'lowpass', 'bandpass')
+CHUNK_SIZE = 1 << 16
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class FilterService:
+    """Asyncio HTTP service exposing the Gaussian filters, one image per request.
+
+    POST /highpass?D0=10, /lowpass?D0=10 or /bandpass?D0_low=5&D0_high=30 with an .npy
+    encoded (a, b) or (a, b, c) image as body returns the filtered image as .npy. GET /stats
+    reports the queue depth and a histogram of batch sizes.
+
+    Requests for images of the same shape and dtype that arrive within `window` seconds of
+    each other are coalesced into one batched forward/inverse FFT. Once `max_queue` requests
+    are waiting or running, new ones are rejected with 503 so callers back off. Bodies larger
+    than max_body bytes are rejected with 413 before they are read.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, window=0.005, max_batch=16, max_queue=64, workers=None, max_body=256 * 1024**2):
+        self.host = host
+        self.port = port
+        self.window = window
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.workers = workers
+        self.max_body = max_body
+        self.queue_depth = 0
+        self.batch_sizes = Counter()
+        self.rejected = 0
+        self._pending = {}
+        self._tasks = set()  # Strong references so running batches are not garbage collected
+        self._server = None
+
+    async def start(self):
+        """Function to start listening; returns once the socket is bound."""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]  # Resolve port=0
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            'rejected': self.rejected,
+        }
+
+    async def filter(self, A, filter_type, D0=None, D0_low=None, D0_high=None):
+        """Function to queue one image and wait for its batch to be filtered."""
+        self.queue_depth += 1
+        try:
+            return await self._submit(A, filter_type, D0, D0_low, D0_high)
+        finally:
+            self.queue_depth -= 1
+
+    async def _submit(self, A, filter_type, D0, D0_low, D0_high):
+        # The caller holds a queue slot for this request
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (A.shape, A.dtype.str)
+        batch = self._pending.setdefault(key, [])
+        batch.append((A, filter_type, D0, D0_low, D0_high, future))
+        if len(batch) == 1:
+            loop.call_later(self.window, self._flush, key, batch)
+        if len(batch) >= self.max_batch:
+            self._flush(key, batch)
+        return await future
+
+    def _flush(self, key, batch):
+        # The window timer may fire after the batch was already flushed for being full
+        if self._pending.get(key) is not batch:
+            return
+        del self._pending[key]
+        self.batch_sizes[len(batch)] += 1
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(None, self._filter_batch, batch)
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (*_, future), F1 in zip(batch, results):
+            if not future.done():
+                future.set_result(F1)
+
+    def _filter_batch(self, batch):
+        # Requests for the same filter share one transfer function and one batched FFT
+        groups = {}
+        for index, (_, filter_type, D0, D0_low, D0_high, _) in enumerate(batch):
+            spec = (filter_type, None, D0_low, D0_high) if filter_type == 'bandpass' else (filter_type, D0, None, None)
+            groups.setdefault(spec, []).append(index)
+
+        results = [None] * len(batch)
+        for (filter_type, D0, D0_low, D0_high), indices in groups.items():
+            stack = np.stack([batch[index][0] for index in indices])
+            [n, a, b, c] = stack.shape
+            W = gaussian_transfer((2*a, 2*b), filter_type, D0, D0_low, D0_high, dtype=stack.dtype)
+            for index, F1 in zip(indices, filter_stack(stack, [W], workers=self.workers)[0]):
+                results[index] = F1
+        return results
+
+    async def _handle(self, reader, writer):
+        try:
+            status, body, content_type = await self._respond(reader)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, EOFError) as e:
+            status, body, content_type = 400, f'Invalid request: {e}'.encode(), 'text/plain'
+        except Exception as e:
+            status, body, content_type = 500, f'{type(e).__name__}: {e}'.encode(), 'text/plain'
+        try:
+            await self._write(writer, status, body, content_type)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            return 400, b'Malformed request line', 'text/plain'
+        method, target, _ = request_line
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        route = url.path.strip('/')
+        if route == 'stats':
+            return 200, json.dumps(self.stats()).encode(), 'application/json'
+        if route not in FILTER_TYPES:
+            return 404, f'Unknown route: {url.path}'.encode(), 'text/plain'
+        if method != 'POST':
+            return 405, b'Use POST with an .npy image body', 'text/plain'
+
+        # Backpressure: refuse before reading the body so a flood costs us little. The slot is
+        # taken now, so bodies still uploading count towards max_queue too.
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            return 503, b'Queue full, retry later', 'text/plain'
+        self.queue_depth += 1
+        try:
+            return await self._accept(reader, headers, route, url)
+        finally:
+            self.queue_depth -= 1
+
+    async def _accept(self, reader, headers, route, url):
+        query = {name: float(values[0]) for name, values in parse_qs(url.query).items()}
+        D0 = query.get('D0')
+        D0_low = query.get('D0_low')
+        D0_high = query.get('D0_high')
+        if route == 'bandpass' and (D0_low is None or D0_high is None):
+            return 400, b'D0_low and D0_high must be provided for bandpass filter', 'text/plain'
+        if route != 'bandpass' and D0 is None:
+            return 400, b'D0 must be provided', 'text/plain'
+        cutoffs = (D0_low, D0_high) if route == 'bandpass' else (D0,)
+        if not all(np.isfinite(cutoff) and cutoff > 0 for cutoff in cutoffs):
+            return 400, b'Cutoff frequencies must be positive and finite', 'text/plain'
+
+        if 'content-length' not in headers:
+            return 411, b'Content-Length is required', 'text/plain'
+        length = int(headers['content-length'])
+        if length <= 0:
+            return 400, b'Empty body: expected an .npy image', 'text/plain'
+        if length > self.max_body:
+            return 413, f'Body larger than {self.max_body} bytes'.encode(), 'text/plain'
+        A = np.load(io.BytesIO(await reader.readexactly(length)), allow_pickle=False)
+        if A.ndim not in (2, 3) or not np.issubdtype(A.dtype, np.floating):
+            return 400, b'Expected a float (a, b) or (a, b, c) image', 'text/plain'
+
+        F1 = await self._submit(A.reshape(A.shape[0], A.shape[1], -1), route, D0, D0_low, D0_high)
+        out = io.BytesIO()
+        np.save(out, F1.reshape(A.shape))
+        return 200, out.getvalue(), 'application/octet-stream'
+
+    async def _write(self, writer, status, body, content_type):
+        head = (
+            f'HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Transfer-Encoding: chunked\r\n'
+            f'Connection: close\r\n'
+        )
+        if status == 503:
+            head += 'Retry-After: 1\r\n'
+        writer.write((head + '\r\n').encode('latin-1'))
+        # Stream the body in chunks, waiting for the socket to drain between them
+        view = memoryview(body)
+        for start in range(0, len(view), CHUNK_SIZE):
+            chunk = view[start:start + CHUNK_SIZE]
+            writer.write(f'{len(chunk):x}\r\n'.encode('latin-1'))
+            writer.write(chunk)
+            writer.write(b'\r\n')
+            await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+
+async def request_filter(A, filter_type, host='127.0.0.1', port=8765, **params):
+    """Function to send one image to a running FilterService and return (status, result)."""
+    reader, writer = await asyncio.open_connection(host, port)
+    payload = io.BytesIO()
+    np.save(payload, A)
+    body = payload.getvalue()
+    query = '&'.join(f'{name}={value}' for name, value in params.items() if value is not None)
+    writer.write(
+        f'POST /{filter_type}?{query} HTTP/1.1\r\nHost: {host}\r\n'
+        f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + body
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    while (await reader.readline()).strip():
+        pass  # Skip headers; the service always answers chunked
+    chunks = []
+    while True:
+        size = int((await reader.readline()).strip(), 16)
+        if size == 0:
+            break
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+    writer.close()
+
+    data = b''.join(chunks)
+    if status != 200:
+        return status, data.decode()
+    return status, np.load(io.BytesIO(data), allow_pickle=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Gaussian frequency domain filters over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--window', type=float, default=0.005, help='Seconds to wait for requests to coalesce')
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--max-queue', type=int, default=64)
+    parser.add_argument('--max-body-mb', type=int, default=256, help='Largest accepted request body in MiB')
+    args = parser.parse_args()
+
+    service = FilterService(args.host, args.port, args.window, args.max_batch, args.max_queue, workers=-1,
+                            max_body=args.max_body_mb * 1024**2)
+    print(f"Serving on http://{args.host}:{args.port}")
+    asyncio.run(service.serve_forever())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+import gfsk_batch
+from gfsk_batch import fft_filter_batch
+from gfsk_cache import SpectrumCache
+from gfsk_opt import filter_image
+
+
+@pytest.fixture
+def images():
+    rng = np.random.default_rng(0)
+    return [rng.random((30, 44, 3)) for _ in range(3)]
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Count the images each batched forward and inverse transform is run on."""
+    calls = {'forward_stack': [], 'inverse_stack': []}
+    for name in calls:
+        original = getattr(gfsk_batch, name)
+
+        def counted(F, *args, _name=name, _original=original, **kwargs):
+            calls[_name].append(len(F))
+            return _original(F, *args, **kwargs)
+        monkeypatch.setattr(gfsk_batch, name, counted)
+    return calls
+
+
+def assert_same(results, expected):
+    for outputs, outputs_expected in zip(results, expected):
+        for (F1, *_), (F1_expected, *_) in zip(outputs, outputs_expected):
+            np.testing.assert_allclose(F1, F1_expected, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('padding', ['double', 'zero'])
+def test_integer_images_are_scaled(padding):
+    rng = np.random.default_rng(1)
+    raw = [(rng.random((30, 44, 3)) * 255).astype(np.uint8) for _ in range(2)]
+    results = fft_filter_batch(raw, [3, 8], 'lowpass', padding=padding)
+    expected = [filter_image(A.astype(np.float32) / 255, [3, 8], 'lowpass', padding=padding) for A in raw]
+    for outputs, outputs_expected in zip(results, expected):
+        for (F1, *_), (F1_expected, *_) in zip(outputs, outputs_expected):
+            assert F1.dtype == np.float32
+            np.testing.assert_allclose(F1, F1_expected, rtol=0, atol=1e-6)
+    assert fft_filter_batch([np.zeros((4, 4, 3), dtype=bool)], [3]) is None
+
+
+def test_sweep_only_computes_new_outputs(tmp_path, images, calls):
+    cache = SpectrumCache(str(tmp_path))
+    fft_filter_batch(images, [3, 10], 'highpass', cache=cache)
+    assert calls == {'forward_stack': [3], 'inverse_stack': [3, 3]}
+
+    results = fft_filter_batch(images, [3, 10, 20], 'highpass', cache=cache)
+    assert calls == {'forward_stack': [3], 'inverse_stack': [3, 3, 3]}  # Only the D0=20 inverse is new
+    assert_same(results, [filter_image(A, [3, 10, 20], 'highpass') for A in images])
+
+
+def test_spectra_are_shared_per_image(tmp_path, images, calls):
+    cache = SpectrumCache(str(tmp_path))
+    filter_image(images[0], [3], 'lowpass', cache=cache)  # Caches the first image's spectrum
+
+    results = fft_filter_batch(images, [3, 10], 'lowpass', cache=cache)
+    # Only the two uncached images are transformed; D0=3 is already cached for the first
+    assert calls == {'forward_stack': [2], 'inverse_stack': [2, 3]}
+    assert_same(results, [filter_image(A, [3, 10], 'lowpass') for A in images])
+
+    [(F1, *_)] = filter_image(images[2], [10], 'lowpass', cache=cache)
+    assert isinstance(F1, np.memmap)  # Stored by the batch under filter_image's key
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from numpy.fft import fft2, ifft2, fftshift, ifftshift
+import gfsk_Block
+from gfsk_Block import tile_ranges
+
+# (block_size, overlap, border_size), including overlap=0 and tiles that overrun the image
+GEOMETRIES = [(256, 16, 50), (64, 16, 10), (100, 50, 50), (64, 0, 0), (50, 30, 5), (37, 11, 3)]
+
+
+def serial_reference(A, D0, block_size, overlap, border_size):
+    """The original one-tile-at-a-time loop, where later tiles overwrite earlier ones."""
+    [a, b, c] = A.shape
+    a_padded, b_padded = a + 2 * border_size, b + 2 * border_size
+    A_padded = np.zeros((a_padded, b_padded, c))
+    A_padded[border_size:a + border_size, border_size:b + border_size] = A
+    filtered_image = np.zeros_like(A_padded)
+    for i in range(0, a_padded, block_size - overlap):
+        for j in range(0, b_padded, block_size - overlap):
+            i_start, j_start = max(i - overlap, 0), max(j - overlap, 0)
+            i_end, j_end = min(i + block_size + overlap, a_padded), min(j + block_size + overlap, b_padded)
+            block = A_padded[i_start:i_end, j_start:j_end]
+            [bi, bj, _] = block.shape
+            u, v = np.mgrid[-bi:bi, -bj:bj]
+            W = np.exp(-(u**2 + v**2) / (2 * D0**2))[:, :, np.newaxis]
+            G = fftshift(fft2(block, s=(2*bi, 2*bj), axes=(0, 1)), axes=(0, 1)) * W
+            F1 = np.clip(np.real(ifft2(ifftshift(G, axes=(0, 1)), axes=(0, 1))[:bi, :bj]), 0, 1)
+            i0, i1 = max(i, i_start + overlap), min(i + block_size, i_end - overlap)
+            j0, j1 = max(j, j_start + overlap), min(j + block_size, j_end - overlap)
+            filtered_image[i0:i1, j0:j1] = F1[i0 - i_start:i1 - i_start, j0 - j_start:j1 - j_start]
+    return filtered_image[border_size:a + border_size, border_size:b + border_size]
+
+
+@pytest.mark.parametrize('length', [90, 130, 257])
+@pytest.mark.parametrize('block_size, overlap, border_size', GEOMETRIES)
+def test_write_windows_are_disjoint(length, block_size, overlap, border_size):
+    written = np.zeros(length + 2 * border_size, dtype=int)
+    for start, end, write_start, write_end in tile_ranges(length + 2 * border_size, block_size, overlap):
+        assert start <= write_start < write_end <= end
+        written[write_start:write_end] += 1
+    assert written.max() == 1
+
+
+@pytest.mark.parametrize('block_size, overlap, border_size', GEOMETRIES)
+def test_matches_serial_loop_in_any_order(block_size, overlap, border_size):
+    A = np.random.default_rng(0).random((90, 130, 3))
+    # Small batches on several workers finish out of order
+    results = gfsk_Block.fft_filter(A, [4, 12], 'lowpass', None, None, block_size, overlap, border_size,
+                                    workers=3, batch_tiles=2, save=False)
+    for F1, filter_type, D0, _, _ in results:
+        np.testing.assert_allclose(F1, serial_reference(A, D0, block_size, overlap, border_size), rtol=0, atol=1e-12)
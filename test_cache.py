@@ -0,0 +1,54 @@
+import os
+import time
+import numpy as np
+import gfsk_opt
+from gfsk_cache import SpectrumCache
+from gfsk_opt import filter_image
+
+
+def test_key_separates_padding_and_dtype(tmp_path):
+    cache = SpectrumCache(str(tmp_path))
+    A = np.random.default_rng(0).random((20, 30, 3))
+    key = cache.image_key(A, (40, 60), 'double')
+    assert key == cache.image_key(A.copy(), (40, 60), 'double')
+    assert key != cache.image_key(A, (40, 60), 'zero')
+    assert key != cache.image_key(A, (32, 48), 'double')
+    assert key != cache.image_key(A.astype(np.float32), (40, 60), 'double')
+
+
+def test_evicts_least_recently_used_first(tmp_path):
+    cache = SpectrumCache(str(tmp_path), max_bytes=10**9)
+    block = np.zeros(1000)
+    for n in range(4):
+        cache.save_result('key', f'spec{n}', block)
+        path = os.path.join(str(tmp_path), f'key_spec{n}.npy')
+        os.utime(path, (time.time() - 100 + n, time.time() - 100 + n))
+    size = os.path.getsize(os.path.join(str(tmp_path), 'key_spec0.npy'))
+    assert cache.load_result('key', 'spec0') is not None  # Now the most recently used
+
+    cache.max_bytes = 2 * size
+    cache.evict()
+    assert sorted(os.listdir(str(tmp_path))) == ['key_spec0.npy', 'key_spec3.npy']
+
+
+def test_sweep_only_computes_new_outputs(tmp_path, monkeypatch):
+    cache = SpectrumCache(str(tmp_path))
+    A = np.random.default_rng(1).random((24, 36, 3))
+    calls = {'rfft2': 0, 'irfft2': 0}
+    for name in calls:
+        original = getattr(gfsk_opt, name)
+
+        def counted(*args, _name=name, _original=original, **kwargs):
+            calls[_name] += 1
+            return _original(*args, **kwargs)
+        monkeypatch.setattr(gfsk_opt, name, counted)
+
+    first = filter_image(A, [3, 10], 'lowpass', cache=cache)
+    assert calls == {'rfft2': 1, 'irfft2': 2}
+    second = filter_image(A, [3, 10, 20], 'lowpass', cache=cache)
+    assert calls == {'rfft2': 1, 'irfft2': 3}  # The spectrum and the first two outputs come from the cache
+
+    expected = filter_image(A, [3, 10, 20], 'lowpass')
+    for (F1, *_), (F1_expected, *_) in zip(second, expected):
+        np.testing.assert_allclose(F1, F1_expected, rtol=0, atol=1e-15)
+    np.testing.assert_array_equal(first[0][0], second[0][0])
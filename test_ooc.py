@@ -0,0 +1,63 @@
+import tracemalloc
+import numpy as np
+import pytest
+import gfsk_ooc
+from gfsk_opt import filter_image
+from gfsk_ooc import ooc_filter
+
+FILTERS = [
+    ('lowpass', [3, 8], None, None),
+    ('highpass', [5], None, None),
+    ('bandpass', [10], 4, 12),
+]
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).random((45, 70, 3))
+
+
+@pytest.mark.parametrize('padding', ['double', 'zero'])
+@pytest.mark.parametrize('filter_type, D0_values, D0_low, D0_high', FILTERS)
+def test_matches_filter_image(tmp_path, image, padding, filter_type, D0_values, D0_low, D0_high):
+    path = tmp_path / 'image.npy'
+    np.save(path, image)
+    # A small budget forces several row strips and column blocks
+    results = ooc_filter(str(path), D0_values, filter_type, D0_low, D0_high, out_dir=str(tmp_path / 'out'),
+                         scratch_dir=str(tmp_path), strip_bytes=64 * 1024, padding=padding)
+    expected = filter_image(image, D0_values, filter_type, D0_low, D0_high, padding=padding)
+    for (F1, *_), (F1_expected, *_) in zip(results, expected):
+        np.testing.assert_allclose(F1, F1_expected, rtol=0, atol=1e-12)
+
+
+def test_grayscale_and_integer_input(tmp_path, image):
+    A = (image[:, :, 0] * 255).astype(np.uint8)
+    [(F1, *_)] = ooc_filter(A, [6], 'lowpass', out_dir=str(tmp_path), strip_bytes=64 * 1024)
+    [(F1_expected, *_)] = filter_image((A / 255.0)[:, :, np.newaxis], [6], 'lowpass')
+    np.testing.assert_allclose(F1, F1_expected[:, :, 0], rtol=0, atol=1e-12)
+
+
+def test_budget_below_one_column_is_rejected(tmp_path, image):
+    with pytest.raises(ValueError, match='too small'):
+        ooc_filter(image, [5], 'lowpass', out_dir=str(tmp_path), strip_bytes=1024)
+
+
+def test_small_image_stays_small_at_default_budget(tmp_path, image, monkeypatch):
+    shapes = []
+    original = gfsk_ooc.scratch_blocks
+
+    def recorded(*args, **kwargs):
+        blocks = original(*args, **kwargs)
+        shapes.append(blocks.shape)
+        return blocks
+    monkeypatch.setattr(gfsk_ooc, 'scratch_blocks', recorded)
+
+    tracemalloc.start()
+    try:
+        ooc_filter(image, [5], 'lowpass', out_dir=str(tmp_path))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # 45 x 70 x 3 doubled to 90 x 140: one block holding exactly the Qh = 71 columns
+    assert shapes == [(1, 45, 71, 3), (1, 45, 71, 3)]
+    assert peak < 4 * 90 * 71 * 3 * 16
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from gfsk_opt import halo_width, padding_geometry, filter_image
+
+
+@pytest.mark.parametrize('length', [64, 300, 1000])
+@pytest.mark.parametrize('D0', [1, 3, 10, 40])
+@pytest.mark.parametrize('tol', [1e-2, 1e-3, 1e-6])
+def test_halo_reaches_tol(length, D0, tol):
+    # The spatial kernel of cutoff D0 (in bins of the 2 * length grid) has sigma = length / (pi * D0)
+    sigma = length / (np.pi * D0)
+    halo = halo_width(length, D0, tol)
+    assert np.exp(-halo**2 / (2 * sigma**2)) <= tol
+    assert np.exp(-(halo - 1)**2 / (2 * sigma**2)) > tol
+
+
+@pytest.mark.parametrize('padding', ['zero', 'reflect', 'symmetric'])
+@pytest.mark.parametrize('D0', [0.5, 1, 3, 10, 50])
+def test_geometry_never_exceeds_doubled_shape(padding, D0):
+    a, b = 512, 300
+    (P, Q), (top, left) = padding_geometry(a, b, D0, padding)
+    assert P <= 2*a and Q <= 2*b
+    assert P >= a + 2*top and Q >= b + 2*left
+    if padding == 'zero':
+        assert (top, left) == (0, 0)
+        assert P >= min(a + halo_width(a, D0), 2*a) and Q >= min(b + halo_width(b, D0), 2*b)
+
+
+def test_doubled_geometry():
+    assert padding_geometry(100, 70, 3, 'double') == ((200, 140), (0, 0))
+    with pytest.raises(ValueError):
+        padding_geometry(100, 70, 3, 'wrap')
+
+
+@pytest.mark.parametrize('filter_type, D0_values, D0_low, D0_high', [
+    ('lowpass', [3, 10, 30], None, None),
+    ('highpass', [3, 10, 30], None, None),
+    ('bandpass', [10], 5, 20),
+])
+def test_zero_halo_matches_doubled_padding_within_tol(filter_type, D0_values, D0_low, D0_high):
+    A = np.random.default_rng(0).random((120, 90, 3))
+    tol = 1e-3
+    doubled = filter_image(A, D0_values, filter_type, D0_low, D0_high, padding='double')
+    halo = filter_image(A, D0_values, filter_type, D0_low, D0_high, padding='zero', tol=tol)
+    for (F1, *_), (F1_halo, *_) in zip(doubled, halo):
+        assert np.abs(F1 - F1_halo).max() <= tol
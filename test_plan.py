@@ -0,0 +1,42 @@
+import sys
+import pytest
+from gfsk_plan import DEFAULT_BANK, candidate_plans, measure_peak, describe, format_bytes, gpu_available
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='peak RSS needs the resource module')
+
+SHAPES = [(256, 256, 3), (300, 500, 3)]
+
+
+def pick(shape, engine, dtype, jobs, block_size=None):
+    for plan in candidate_plans(shape, DEFAULT_BANK, cpus=1):
+        if (plan.engine, plan.dtype, plan.jobs) == (engine, dtype, jobs) and plan.block_size == block_size:
+            return plan
+    raise LookupError(f"No {engine} {dtype} plan with {jobs} job(s) for {shape}")
+
+
+def check(plan, shape):
+    peak = measure_peak(plan, shape, DEFAULT_BANK)
+    # The estimate must cover the measured peak without being so loose that it wastes the budget
+    assert 0.4 * plan.peak_bytes <= peak <= plan.peak_bytes, (
+        f"{describe(plan)} on {shape}: measured {format_bytes(peak)}, estimated {format_bytes(plan.peak_bytes)}")
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+@pytest.mark.parametrize('dtype', ['float32', 'float64'])
+@pytest.mark.parametrize('jobs', [1, len(DEFAULT_BANK)])
+def test_whole_estimate_covers_peak_rss(shape, dtype, jobs):
+    check(pick(shape, 'whole', dtype, jobs), shape)
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+@pytest.mark.parametrize('block_size', [128, 256])
+@pytest.mark.parametrize('jobs', [1, len(DEFAULT_BANK)])
+def test_tiled_estimate_covers_peak_rss(shape, block_size, jobs):
+    check(pick(shape, 'tiled', 'float64', jobs, block_size), shape)
+
+
+@pytest.mark.skipif(gpu_available() is None, reason='torch is not installed')
+def test_gpu_estimate_covers_peak_rss():
+    shape = SHAPES[0]
+    check(pick(shape, 'gpu', 'float32', 1), shape)
+
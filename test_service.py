@@ -0,0 +1,112 @@
+import io
+import json
+import asyncio
+import numpy as np
+from gfsk_opt import filter_image
+from gfsk_service import FilterService, request_filter
+
+
+async def send(port, head, body=b''):
+    """Send a raw request and return (status, body text); the reply is chunked."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    while (await reader.readline()).strip():
+        pass
+    chunks = []
+    while True:
+        size = int((await reader.readline()).strip(), 16)
+        if size == 0:
+            break
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+    writer.close()
+    return status, b''.join(chunks).decode('latin-1')
+
+
+def npy(A):
+    out = io.BytesIO()
+    np.save(out, A)
+    return out.getvalue()
+
+
+def test_concurrent_requests_are_coalesced():
+    rng = np.random.default_rng(0)
+    images = [rng.random((32, 40, 3)) for _ in range(9)]
+    filters = [('lowpass', {'D0': 5}), ('highpass', {'D0': 10}), ('bandpass', {'D0_low': 4, 'D0_high': 12})]
+
+    async def run():
+        service = await FilterService(port=0, window=0.2, max_batch=8).start()
+        try:
+            replies = await asyncio.gather(*(
+                request_filter(A, filters[n % 3][0], port=service.port, **filters[n % 3][1])
+                for n, A in enumerate(images)))
+            stats = json.loads((await send(service.port, 'GET /stats HTTP/1.1\r\n\r\n'))[1])
+        finally:
+            await service.close()
+        return replies, stats
+
+    replies, stats = asyncio.run(run())
+    for n, (A, (status, F1)) in enumerate(zip(images, replies)):
+        filter_type, params = filters[n % 3]
+        [(expected, *_)] = filter_image(A, [params.get('D0')], filter_type, params.get('D0_low'), params.get('D0_high'))
+        assert status == 200
+        np.testing.assert_allclose(F1, expected, rtol=0, atol=1e-12)
+    assert stats['batch_sizes'] == {'1': 1, '8': 1}
+    assert stats['queue_depth'] == 0
+
+
+def test_bad_requests_are_answered():
+    body = npy(np.zeros((8, 8)))
+
+    async def run():
+        service = await FilterService(port=0, max_body=len(body)).start()
+        try:
+            return [
+                await send(service.port, 'POST /lowpass?D0=5 HTTP/1.1\r\n\r\n'),
+                await send(service.port, 'POST /lowpass?D0=5 HTTP/1.1\r\nContent-Length: 0\r\n\r\n'),
+                await send(service.port, 'POST /lowpass?D0=5 HTTP/1.1\r\nContent-Length: 5\r\n\r\n', b'abcde'),
+                await send(service.port, f'POST /lowpass?D0=5 HTTP/1.1\r\nContent-Length: {len(body) + 1}\r\n\r\n'),
+                await send(service.port, f'POST /highpass?D0=0 HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n', body),
+                await send(service.port, f'POST /bandpass?D0_low=inf&D0_high=5 HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n', body),
+                await send(service.port, f'POST /lowpass?D0=5 HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n', body),
+            ]
+        finally:
+            await service.close()
+
+    statuses = [status for status, _ in asyncio.run(run())]
+    assert statuses == [411, 400, 400, 413, 400, 400, 200]
+
+
+def test_uploads_in_progress_count_towards_the_queue():
+    body = npy(np.zeros((8, 8)))
+    head = f'POST /lowpass?D0=5 HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n'
+
+    async def run():
+        service = await FilterService(port=0, max_queue=2).start()
+        try:
+            # Two clients send their headers and stall before the body
+            stalled = []
+            for _ in range(2):
+                reader, writer = await asyncio.open_connection('127.0.0.1', service.port)
+                writer.write(head.encode('latin-1'))
+                await writer.drain()
+                stalled.append((reader, writer))
+            while service.queue_depth < 2:
+                await asyncio.sleep(0.01)
+
+            rejected = await send(service.port, head, body)
+            for reader, writer in stalled:
+                writer.write(body)
+                await writer.drain()
+                await reader.read()
+                writer.close()
+            accepted = await send(service.port, head, body)
+            return rejected[0], accepted[0], service.stats()
+        finally:
+            await service.close()
+
+    rejected, accepted, stats = asyncio.run(run())
+    assert (rejected, accepted) == (503, 200)
+    assert stats['rejected'] == 1 and stats['queue_depth'] == 0